@@ -0,0 +1,104 @@
+from h2mHelper import h2m_field, h2m_record, FieldType
+import logging
+
+logging.basicConfig(
+    format='[%(asctime)s] %(levelname)-2s %(message)s',
+    level=logging.INFO,
+    datefmt='%H:%M:%S')
+
+class h2m_aggregator():
+    """Aggregates the records of consecutive frames into one record per window.
+
+    FLOAT fields publish the mean, INT and STR fields the last value and BOOL fields
+    whether they were on at any time in the window. Running min/max/sum/on counters are
+    updated per frame, with extra_entities the min/max (FLOAT) and the on-fraction (BOOL)
+    are added as extra fields. With publish_first the first frame is emitted right away, so
+    a restart does not delay the first publish by a whole window.
+    """
+    def __init__(self, loglevel, window=20, extra_entities=False, publish_first=True) -> None:
+        logging.getLogger().setLevel(loglevel)
+        self.window = window
+        self.publish_first = publish_first
+        self.extra_entities = extra_entities
+        self.fields = None
+        self.output_fields = None
+        self.extra_metas = {}
+        self.count = 0
+
+    def __setup(self, fields):
+        self.fields = fields
+        self.floats = [i for i, meta in enumerate(fields) if meta.field_type == FieldType.FLOAT]
+        self.bools = [i for i, meta in enumerate(fields) if meta.field_type == FieldType.BOOL]
+        extras = []
+        if self.extra_entities:
+            for i in self.floats:
+                extras.append(self.__extra_meta(fields[i], "min", "Min", fields[i].unit))
+                extras.append(self.__extra_meta(fields[i], "max", "Max", fields[i].unit))
+            for i in self.bools:
+                extras.append(self.__extra_meta(fields[i], "anteil", "Anteil", "%"))
+        self.output_fields = fields + tuple(extras)
+        self.__reset()
+        logging.debug(f"Aggregating {len(fields)} fields over {self.window} frames, {len(extras)} extra fields")
+
+    def __extra_meta(self, meta, suffix, visible_suffix, unit):
+        key = (meta.field, suffix)
+        extra = self.extra_metas.get(key)
+        if extra is None:
+            device_clazz = meta.device_clazz if meta.field_type == FieldType.FLOAT else None
+            extra = h2m_field(f"{meta.field}_{suffix}", f"{meta.visible_name} {visible_suffix}", field_type=FieldType.FLOAT, device_clazz=device_clazz, state_clazz="measurement", unit=unit, icon=meta.icon, enabled=False, deadband=meta.deadband, max_interval=meta.max_interval, trigger=False)
+            self.extra_metas[key] = extra
+        return extra
+
+    def __reset(self):
+        size = len(self.fields)
+        self.count = 0
+        self.last = [None] * size
+        self.sum = [0.0] * size
+        self.min = [None] * size
+        self.max = [None] * size
+        self.on = [0] * size
+
+    def add(self, record):
+        """Add the record of one frame, returns the aggregated record when the window is complete."""
+        if record.fields is not self.fields:
+            if self.count > 0:
+                logging.debug("Schema changed, dropping incomplete window")
+            self.__setup(record.fields)
+
+        values = record.values
+        self.last = values
+        for i in self.floats:
+            value = values[i]
+            self.sum[i] += value
+            if self.min[i] is None or value < self.min[i]:
+                self.min[i] = value
+            if self.max[i] is None or value > self.max[i]:
+                self.max[i] = value
+        for i in self.bools:
+            if values[i]:
+                self.on[i] += 1
+        self.count += 1
+
+        if self.count >= self.window or self.publish_first:
+            self.publish_first = False
+            return self.flush()
+        return None
+
+    def flush(self):
+        """Emit the aggregated record of the current, possibly incomplete, window."""
+        if self.count == 0:
+            return None
+        count = self.count
+        values = list(self.last)
+        for i in self.floats:
+            values[i] = round(self.sum[i] / count, 3)
+        for i in self.bools:
+            values[i] = self.on[i] > 0
+        if self.extra_entities:
+            for i in self.floats:
+                values.append(self.min[i])
+                values.append(self.max[i])
+            for i in self.bools:
+                values.append(round(100.0 * self.on[i] / count, 1))
+        self.__reset()
+        return h2m_record(self.output_fields, values)
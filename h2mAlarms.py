@@ -0,0 +1,154 @@
+from collections import deque
+from h2mHelper import h2m_field, h2m_record, FieldType
+import logging
+
+logging.basicConfig(
+    format='[%(asctime)s] %(levelname)-2s %(message)s',
+    level=logging.INFO,
+    datefmt='%H:%M:%S')
+
+class h2m_condition():
+    """Tests one field per frame, O(1) per frame.
+
+    equals: active while the value is one of the values.
+    above/below: active while the value (or its rate of change per minute over rate_window
+    seconds) is above or below the limit, with both it is a range the value has to stay in.
+    An active condition clears only after it is back inside the limits by hysteresis.
+    """
+    def __init__(self, field, equals=None, above=None, below=None, hysteresis=0.0, rate_window=None) -> None:
+        if equals is None and above is None and below is None:
+            raise ValueError(f"condition on {field} needs equals, above or below")
+        self.field = field
+        self.equals = frozenset(equals) if equals is not None else None
+        self.above = above
+        self.below = below
+        self.hysteresis = hysteresis
+        self.rate_window = rate_window
+        self.history = deque()
+        self.active = False
+        self.value = None
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config["field"], equals=config.get("equals"), above=config.get("above"), below=config.get("below"), hysteresis=config.get("hysteresis", 0.0), rate_window=config.get("rate_window"))
+
+    def __rate(self, value, now):
+        # change per minute between the oldest value in the window and now
+        history = self.history
+        history.append((now, value))
+        while now - history[0][0] > self.rate_window:
+            history.popleft()
+        first_time, first_value = history[0]
+        if now - first_time < self.rate_window / 2:
+            return None
+        return (value - first_value) / (now - first_time) * 60.0
+
+    def update(self, value, now):
+        if self.rate_window is not None:
+            value = self.__rate(value, now)
+            if value is None:
+                return self.active
+        self.value = value
+        if self.equals is not None:
+            self.active = value in self.equals
+            return self.active
+        # inside the limits, narrowed by the hysteresis while active
+        margin = self.hysteresis if self.active else 0.0
+        outside = (self.above is not None and value > self.above - margin) or (self.below is not None and value < self.below + margin)
+        self.active = outside
+        return self.active
+
+class h2m_alarm_rule():
+    """An alarm raised when its condition holds for `for_seconds`, while the optional `when` condition holds."""
+    def __init__(self, name, visible_name, condition, for_seconds=0.0, when=None, severity="warning") -> None:
+        self.name = name
+        self.visible_name = visible_name
+        self.condition = condition
+        self.for_seconds = for_seconds
+        self.when = when
+        self.severity = severity
+        self.meta = h2m_field(f"alarm_{name}", f"Alarm {visible_name}", field_type=FieldType.BOOL, device_clazz="problem")
+        self.since = None
+        self.active = False
+
+    @classmethod
+    def from_config(cls, config):
+        when = h2m_condition.from_config(config["when"]) if config.get("when") is not None else None
+        return cls(config["name"], config.get("visible_name", config["name"]), h2m_condition.from_config(config), for_seconds=config.get("for", 0.0), when=when, severity=config.get("severity", "warning"))
+
+class h2m_alarms():
+    """Evaluates alarm rules on every frame, returns the alarms raised or cleared by it.
+
+    Field positions are resolved once per schema, every rule costs O(1) amortized per frame.
+    record() holds the alarm states as binary problem sensors for the state payload.
+    """
+    def __init__(self, loglevel, rules) -> None:
+        logging.getLogger().setLevel(loglevel)
+        self.rules = tuple(rules)
+        self.fields = tuple(rule.meta for rule in self.rules)
+        self.schema = None
+        self.indexes = None
+
+        # counters
+        self.evaluations = 0
+        self.raised = 0
+        self.cleared = 0
+
+    def __setup(self, schemas):
+        names = {}
+        for number, fields in enumerate(schemas):
+            for i, meta in enumerate(fields):
+                names.setdefault(meta.field, (number, i))
+        self.schema = schemas
+        self.indexes = []
+        for rule in self.rules:
+            index = names.get(rule.condition.field)
+            when_index = names.get(rule.when.field) if rule.when is not None else None
+            if index is None or (rule.when is not None and when_index is None):
+                logging.warning(f"Alarm {rule.name}: unknown field {rule.condition.field if index is None else rule.when.field}")
+                index = None
+            self.indexes.append((index, when_index))
+
+    def update(self, now, *records):
+        """Evaluate the records of one frame captured at monotonic time now, returns the rules which changed.
+
+        The fields are looked up in all records, e.g. the serial and the voltage record of a frame.
+        """
+        schemas = tuple(record.fields for record in records)
+        if self.schema is None or len(schemas) != len(self.schema) or any(a is not b for a, b in zip(schemas, self.schema)):
+            self.__setup(schemas)
+        values = [record.values for record in records]
+        changed = []
+        for rule, (index, when_index) in zip(self.rules, self.indexes):
+            if index is None:
+                continue
+            holding = rule.condition.update(values[index[0]][index[1]], now)
+            if rule.when is not None:
+                holding = rule.when.update(values[when_index[0]][when_index[1]], now) and holding
+            if not holding:
+                rule.since = None
+                active = False
+            else:
+                if rule.since is None:
+                    rule.since = now
+                active = now - rule.since >= rule.for_seconds
+            if active != rule.active:
+                rule.active = active
+                if active:
+                    self.raised += 1
+                else:
+                    self.cleared += 1
+                changed.append(rule)
+        self.evaluations += 1
+        return changed
+
+    def record(self):
+        return h2m_record(self.fields, [rule.active for rule in self.rules])
+
+    def stats(self):
+        return {
+            "evaluations": self.evaluations,
+            "raised": self.raised,
+            "cleared": self.cleared,
+            "active": sum(rule.active for rule in self.rules),
+        }
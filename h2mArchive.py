@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""h2mArchive.py
+Compact archive of every captured frame, for offline analysis and replay.
+
+An archive is a directory of segment files. A segment starts with a file header and holds
+blocks of up to block_frames frames. Every block has an uncompressed header with the frame
+count and the wall time range, followed by the zlib compressed columns of its frames:
+monotonic and wall time (float64), ADC voltage (float32, NaN without) and either the raw
+lines (uint16 lengths and the bytes) or the decoded numeric frame columns (float32 per column).
+Reading maps the segments into memory and skips blocks outside the requested time range
+without decompressing them.
+
+Usage:
+    h2mArchive.py <directory> --info
+    h2mArchive.py <directory> [--from <iso time>] [--to <iso time>] --csv <file>
+    h2mArchive.py <directory> [--from <iso time>] [--to <iso time>] --replay <file>
+"""
+from array import array
+from h2mSerialParser import SCHEMA, FRAME_PREFIX, FRAME_COLUMNS
+import argparse
+import csv
+import datetime
+import logging
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+
+logging.basicConfig(
+    format='[%(asctime)s] %(levelname)-2s %(message)s',
+    level=logging.INFO,
+    datefmt='%H:%M:%S')
+
+MAGIC = b"H2MA"
+VERSION = 1
+# magic, version, mode, number of frame columns
+FILE_HEADER = struct.Struct("<4sBBH")
+BLOCK_MAGIC = b"BLK1"
+# magic, frames, compressed length, first and last wall time
+BLOCK_HEADER = struct.Struct("<4sIIdd")
+SEGMENT_SUFFIX = ".h2ma"
+MODES = ("raw", "columns")
+
+# hex coded register columns, all other columns are decimal numbers
+REGISTER_COLUMNS = frozenset(column.column for column in SCHEMA if column.mask is not None)
+
+def decode_columns(line):
+    """The numeric columns after the frame prefix, None if the frame is malformed."""
+    values = line.split(b" ")
+    if len(values) != FRAME_COLUMNS or values[0] != FRAME_PREFIX:
+        return None
+    try:
+        return [float(int(value, 16)) if column in REGISTER_COLUMNS else float(value) for column, value in enumerate(values[1:], 1)]
+    except ValueError:
+        return None
+
+def encode_columns(values):
+    """The frame line of decoded columns, as the Lambdatronic writes it."""
+    columns = [FRAME_PREFIX.decode("ascii")]
+    for column, value in enumerate(values, 1):
+        if column in REGISTER_COLUMNS:
+            columns.append(f"{int(value):x}")
+        else:
+            columns.append(f"{value:g}")
+    return " ".join(columns)
+
+class h2m_archive_writer():
+    """Appends frames to the segments in `directory`.
+
+    Frames are buffered until block_frames are collected or flush_interval seconds passed,
+    a crash loses at most the open block. A new segment is started when the current one
+    reaches segment_bytes or segment_seconds, the oldest segments are deleted beyond
+    retention_bytes or retention_seconds. With mode "columns" only well-formed frames are
+    kept, decoded to numbers, "raw" keeps every line as received.
+    """
+    def __init__(self, directory, loglevel, mode="raw", block_frames=256, flush_interval=60.0, segment_bytes=16 * 1024 * 1024, segment_seconds=86400, retention_bytes=2 * 1024 * 1024 * 1024, retention_seconds=90 * 86400, compression=6) -> None:
+        logging.getLogger().setLevel(loglevel)
+        if mode not in MODES:
+            raise ValueError(f"unknown archive mode: {mode}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.mode = mode
+        self.columns = FRAME_COLUMNS - 1 if mode == "columns" else 0
+        self.block_frames = block_frames
+        self.flush_interval = flush_interval
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.retention_bytes = retention_bytes
+        self.retention_seconds = retention_seconds
+        self.compression = compression
+        self.file = None
+        self.segment_path = None
+        self.segment_started = None
+        self.block_started = None
+        self.__reset()
+
+        # counters
+        self.frames = 0
+        self.skipped = 0
+        self.blocks = 0
+        self.bytes_written = 0
+        self.segments_deleted = 0
+
+    def __reset(self):
+        self.monotonic = array("d")
+        self.wall = array("d")
+        self.voltage = array("f")
+        self.lengths = array("H")
+        self.lines = bytearray()
+        self.values = array("f")
+
+    def add(self, frame, voltage=None):
+        line = frame.line if isinstance(frame.line, bytes) else frame.line.encode("ascii", errors="ignore")
+        if self.mode == "columns":
+            values = decode_columns(line)
+            if values is None:
+                self.skipped += 1
+                return
+            self.values.extend(values)
+        else:
+            line = line[:0xffff]
+            self.lengths.append(len(line))
+            self.lines += line
+        self.monotonic.append(frame.monotonic)
+        self.wall.append(frame.wall)
+        self.voltage.append(voltage if voltage is not None else math.nan)
+        self.frames += 1
+
+        now = time.monotonic()
+        if self.block_started is None:
+            self.block_started = now
+        if len(self.wall) >= self.block_frames or now - self.block_started >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        count = len(self.wall)
+        if count == 0:
+            return
+        payload = self.monotonic.tobytes() + self.wall.tobytes() + self.voltage.tobytes()
+        if self.mode == "columns":
+            # column major, every column compresses on its own values
+            values = self.values
+            payload += b"".join(array("f", values[column::self.columns]).tobytes() for column in range(self.columns))
+        else:
+            payload += self.lengths.tobytes() + bytes(self.lines)
+        compressed = zlib.compress(payload, self.compression)
+        first_wall, last_wall = self.wall[0], self.wall[-1]
+        self.__reset()
+        self.block_started = None
+
+        self.__rotate(first_wall)
+        self.file.write(BLOCK_HEADER.pack(BLOCK_MAGIC, count, len(compressed), first_wall, last_wall) + compressed)
+        self.file.flush()
+        self.blocks += 1
+        self.bytes_written += BLOCK_HEADER.size + len(compressed)
+        logging.debug(f"Archived {count} frames in {len(compressed)} bytes to {self.segment_path}")
+
+    def __rotate(self, wall):
+        if self.file is not None and self.file.tell() < self.segment_bytes and wall - self.segment_started < self.segment_seconds:
+            return
+        if self.file is not None:
+            self.file.close()
+        name = datetime.datetime.fromtimestamp(wall, datetime.UTC).strftime("frames-%Y%m%dT%H%M%S")
+        self.segment_path = os.path.join(self.directory, name + SEGMENT_SUFFIX)
+        self.file = open(self.segment_path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(FILE_HEADER.pack(MAGIC, VERSION, MODES.index(self.mode), self.columns))
+        self.segment_started = wall
+        self.__expire(wall)
+
+    def __expire(self, now):
+        segments = list_segments(self.directory)
+        total = sum(os.path.getsize(path) for path in segments)
+        for path in segments:
+            if path == self.segment_path:
+                break
+            expired = self.retention_seconds is not None and now - os.path.getmtime(path) > self.retention_seconds
+            if not expired and (self.retention_bytes is None or total <= self.retention_bytes):
+                break
+            total -= os.path.getsize(path)
+            os.remove(path)
+            self.segments_deleted += 1
+            logging.info(f"Deleted archive segment {path}")
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "skipped": self.skipped,
+            "blocks": self.blocks,
+            "bytes_written": self.bytes_written,
+            "segments_deleted": self.segments_deleted,
+        }
+
+def list_segments(directory):
+    """Segment files of an archive, oldest first (the names sort by time)."""
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+
+def read_segment(path, start=None, end=None):
+    """Yields (monotonic, wall, voltage, line or columns) of the frames in the wall time range."""
+    with open(path, "rb") as segment:
+        if os.fstat(segment.fileno()).st_size < FILE_HEADER.size:
+            return
+        with mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, version, mode, columns = FILE_HEADER.unpack_from(data, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is no archive segment")
+            offset = FILE_HEADER.size
+            while offset + BLOCK_HEADER.size <= len(data):
+                block_magic, count, length, first_wall, last_wall = BLOCK_HEADER.unpack_from(data, offset)
+                offset += BLOCK_HEADER.size
+                if block_magic != BLOCK_MAGIC or offset + length > len(data):
+                    logging.warning(f"{path}: truncated block at {offset - BLOCK_HEADER.size}")
+                    return
+                if (start is not None and last_wall < start) or (end is not None and first_wall > end):
+                    offset += length
+                    continue
+                payload = zlib.decompress(data[offset:offset + length])
+                offset += length
+                yield from decode_block(payload, count, MODES[mode], columns, start, end)
+
+def decode_block(payload, count, mode, columns, start, end):
+    position = 0
+    def take(typecode, items):
+        nonlocal position
+        values = array(typecode)
+        size = values.itemsize * items
+        values.frombytes(payload[position:position + size])
+        position += size
+        return values
+    monotonic = take("d", count)
+    wall = take("d", count)
+    voltage = take("f", count)
+    if mode == "columns":
+        values = [take("f", count) for _ in range(columns)]
+        frames = ([column[i] for column in values] for i in range(count))
+    else:
+        lengths = take("H", count)
+        lines = []
+        for length in lengths:
+            lines.append(payload[position:position + length])
+            position += length
+        frames = iter(lines)
+    for i, frame in enumerate(frames):
+        if (start is not None and wall[i] < start) or (end is not None and wall[i] > end):
+            continue
+        yield monotonic[i], wall[i], None if math.isnan(voltage[i]) else voltage[i], frame
+
+def read_archive(directory, start=None, end=None):
+    for path in list_segments(directory):
+        yield from read_segment(path, start=start, end=end)
+
+def frame_text(frame):
+    if isinstance(frame, list):
+        return encode_columns(frame)
+    return frame.decode("ascii", errors="ignore")
+
+def export_csv(frames, output):
+    writer = csv.writer(output)
+    header = None
+    for monotonic, wall, voltage, frame in frames:
+        if header is None:
+            header = ["time", "monotonic", "voltage"]
+            header += [f"column_{column}" for column in range(1, len(frame) + 1)] if isinstance(frame, list) else ["line"]
+            writer.writerow(header)
+        row = [datetime.datetime.fromtimestamp(wall, datetime.UTC).isoformat(), f"{monotonic:.3f}", "" if voltage is None else f"{voltage:.4f}"]
+        row += [f"{value:g}" for value in frame] if isinstance(frame, list) else [frame_text(frame)]
+        writer.writerow(row)
+
+def export_replay(frames, output):
+    """Writes the h2mReplay.py recording format, timestamps relative to the first frame."""
+    first = None
+    last_voltage = None
+    for monotonic, wall, voltage, frame in frames:
+        if first is None:
+            first = wall
+            output.write(f"# archived frames from {datetime.datetime.fromtimestamp(wall, datetime.UTC).isoformat()}\n")
+        seconds = wall - first
+        if voltage is not None and voltage != last_voltage:
+            output.write(f"{seconds:.3f}\tvoltage {voltage:.4f}\n")
+            last_voltage = voltage
+        output.write(f"{seconds:.3f}\t{frame_text(frame)}\n")
+
+def parse_time(value):
+    if value is None:
+        return None
+    moment = datetime.datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.astimezone()
+    return moment.timestamp()
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("directory", help="archive directory")
+    arg_parser.add_argument("--from", dest="start", help="first frame time, ISO format, local time without zone")
+    arg_parser.add_argument("--to", dest="end", help="last frame time, ISO format, local time without zone")
+    arg_parser.add_argument("--csv", help="export the frames as CSV, - for stdout")
+    arg_parser.add_argument("--replay", help="export the frames as h2mReplay.py recording, - for stdout")
+    arg_parser.add_argument("--info", action="store_true", help="list the segments with their frames and time range")
+    args = arg_parser.parse_args()
+
+    start, end = parse_time(args.start), parse_time(args.end)
+    if args.info:
+        for path in list_segments(args.directory):
+            count, first, last = 0, None, None
+            for _, wall, _, _ in read_segment(path, start, end):
+                count += 1
+                first = wall if first is None else first
+                last = wall
+            span = "" if first is None else f" {datetime.datetime.fromtimestamp(first).isoformat()} - {datetime.datetime.fromtimestamp(last).isoformat()}"
+            print(f"{path}: {os.path.getsize(path)} bytes, {count} frames{span}")
+    for target, export in ((args.csv, export_csv), (args.replay, export_replay)):
+        if target is None:
+            continue
+        frames = read_archive(args.directory, start, end)
+        if target == "-":
+            export(frames, sys.stdout)
+        else:
+            with open(target, "w", newline="" if export is export_csv else None, encoding="ascii", errors="ignore") as output:
+                export(frames, output)
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""h2mBenchmark.py
+Benchmarks for the hot paths of hargassner2mqtt, runs without any hardware.
+
+Every benchmark reports ns per operation, allocations per operation (tracemalloc, blocks
+and bytes still allocated afterwards plus the transient peak) and, where it applies, the
+payload bytes. Results can be saved as baseline and later runs compared against it.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from h2mHelper import h2m_helper, h2m_record
+from h2mSerialParser import h2m_serial_parser
+from h2mSerialReader import h2m_frame_tokenizer
+from h2mVoltageParser import h2m_voltage_parser
+from h2mBridge import BRIDGE_FIELDS, VOLTAGE_FIELDS
+from h2mReplay import read_recording, replay, h2m_recording_sink
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+CORPUS = os.path.join(BENCHMARK_DIR, "frames.txt")
+BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+
+# A 41 column frame as written by the Lambdatronic every 0.5s
+SAMPLE_FRAME = "pm 35.2 48 8.4 74.5 152.3 4.1 5.2 41.0 20.0 45.0 20.0 61.2 52.7 21 75.0 16 17 18 19 20 21 22 23 24 25 26 27 28 14 1.32 0.00 0.00 5 83a 8 300 0 0 0 0"
+
+# metrics where a higher value is better, everything else regresses when it grows
+HIGHER_IS_BETTER = ("frames_per_second", "publishes_per_second")
+
+def synthetic_frames(count, seed=1):
+    """Frames walking through the boiler states with noisy temperatures and toggling register bits."""
+    rng = random.Random(seed)
+    states = (0, 6, 7, 9, 10, 14, 14, 14, 15, 17, 18)
+    frames = []
+    for i in range(count):
+        status = states[(i // 50) % len(states)]
+        burning = status in (7, 9, 10, 14, 15)
+        columns = ["pm"]
+        columns.append(f"{rng.uniform(20, 60) if burning else 0:.0f}")
+        columns.append(f"{rng.uniform(30, 80) if burning else 0:.0f}")
+        columns.append(f"{rng.uniform(5, 12) if burning else 20.9:.1f}")
+        columns.append(f"{60 + 15 * burning + rng.uniform(-0.5, 0.5):.1f}")
+        columns.append(f"{(140 if burning else 40) + rng.uniform(-5, 5):.1f}")
+        columns.append(f"{4 + rng.uniform(-0.2, 0.2):.1f}")
+        columns.append("5.2")
+        columns += [f"{41 + rng.uniform(-1, 1):.1f}", "20.0", "45.0", "20.0"]
+        columns.append(f"{55 + rng.uniform(-1, 1):.1f}")
+        columns.append(f"{52 + rng.uniform(-1, 1):.1f}")
+        columns.append(f"{rng.uniform(10, 40) if burning else 0:.0f}")
+        columns.append("75.0")
+        columns += [str(n) for n in range(16, 29)]
+        columns.append(str(status))
+        columns.append(f"{rng.uniform(1, 2) if burning and i % 7 == 0 else 0:.2f}")
+        columns += ["0.00", "0.00"]
+        register1 = 1 if burning and i % 7 == 0 else 0
+        register2 = 0x830 | (0x6 if status in (7, 9, 10) else 0) | (0x40 if i % 11 == 0 else 0)
+        register4 = 0x300 if burning else 0x80
+        columns += [f"{register1:x}", f"{register2:x}", "8", f"{register4:x}"]
+        columns += ["0", "0", "0", "0"]
+        frames.append(" ".join(columns))
+    return frames
+
+def load_corpus(path=CORPUS):
+    with open(path, encoding="ascii", errors="ignore") as corpus:
+        return [value for _, kind, value in read_recording(corpus) if kind == "frame"]
+
+def write_corpus(path=CORPUS, count=2000):
+    frames = [SAMPLE_FRAME] + synthetic_frames(count)
+    with open(path, "w", encoding="ascii") as corpus:
+        corpus.write("# Lambdatronic frames for h2mBenchmark.py and h2mReplay.py, 0.5s apart\n")
+        corpus.write("voltage 1.72\n")
+        for i, frame in enumerate(frames):
+            if i % 500 == 250:
+                # line noise and a truncated frame, as seen with a loose cable
+                corpus.write("pm 35.2 48 8.4 74.5\n")
+                corpus.write("~~pm 0 0\n")
+            corpus.write(frame + "\n")
+
+def measure(operation, inputs, repeat):
+    """ns/op over `repeat` calls cycling through inputs, then allocations of one pass over inputs."""
+    count = len(inputs)
+    start = time.perf_counter_ns()
+    for i in range(repeat):
+        operation(inputs[i % count])
+    ns = (time.perf_counter_ns() - start) / repeat
+
+    results = []
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for value in inputs:
+        results.append(operation(value))
+    after = tracemalloc.take_snapshot()
+    # transient peak of a single operation
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    operation(inputs[0])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    diff = after.compare_to(before, "filename")
+    blocks = sum(stat.count_diff for stat in diff) - 1  # the results list
+    size = sum(stat.size_diff for stat in diff)
+    return {
+        "ns_per_op": round(ns),
+        "blocks_per_op": round(blocks / count, 1),
+        "bytes_per_op": round(size / count),
+        "peak_bytes": peak - current,
+    }
+
+def bench_tokenize(frames, repeat):
+    # the received bytes in chunks as returned by the serial port, ns per frame
+    data = b"".join(frame.encode(encoding="ascii") + b"\r\n" for frame in frames)
+    chunks = [data[i:i + 64] for i in range(0, len(data), 64)]
+    best = None
+    for _ in range(5):
+        tokenizer = h2m_frame_tokenizer()
+        start = time.perf_counter_ns()
+        for chunk in chunks:
+            tokenizer.feed(chunk)
+        ns = (time.perf_counter_ns() - start) / tokenizer.frames
+        if best is None or ns < best:
+            best = ns
+    return {
+        "ns_per_op": round(best),
+        "frames": tokenizer.frames,
+        "truncated": tokenizer.truncated,
+        "bytes_skipped": tokenizer.bytes_skipped,
+    }
+
+def bench_serial_parse(frames, repeat):
+    # frames as bytes, as delivered by the serial reader
+    parser = h2m_serial_parser(logging.WARNING)
+    return measure(parser.parse, [frame.encode(encoding="ascii") for frame in frames], repeat)
+
+def bench_voltage_parse(frames, repeat):
+    parser = h2m_voltage_parser(logging.WARNING)
+    voltages = [0.5 + 0.001 * i for i in range(1000)]
+    return measure(parser.parse, voltages, repeat)
+
+def full_records(frames):
+    serial_parser = h2m_serial_parser(logging.WARNING)
+    voltage_parser = h2m_voltage_parser(logging.WARNING)
+    parsed_voltage, _ = voltage_parser.parse(1.72)
+    records = []
+    for frame in frames:
+        parsed_serial_input, valid = serial_parser.parse(frame)
+        if valid:
+            records.append(h2m_record(BRIDGE_FIELDS, [frame, "2026-01-01T00:00:00+00:00"]) + parsed_serial_input + h2m_record(VOLTAGE_FIELDS, [1.72]) + parsed_voltage)
+    return records
+
+def bench_send(frames, repeat, payload="string"):
+    # max_interval=0 publishes every call, it measures the full payload build including json.dumps
+    sink = h2m_recording_sink(keep=False)
+    helper = h2m_helper(sink, logging.WARNING, max_interval=0, payload=payload)
+    records = full_records(frames)
+    helper.send("HSV30", "Lambdatronic", records[0])
+    sink.bytes = 0
+    sink.count = 0
+    result = measure(lambda record: helper.send("HSV30", "Lambdatronic", record), records, repeat)
+    result["payload_bytes"] = round(sink.bytes / sink.count)
+    return result
+
+def bench_send_typed(frames, repeat):
+    return bench_send(frames, repeat, payload="typed")
+
+def bench_announce(frames, repeat, discovery="entity"):
+    # cold announce, a new helper creates and announces every measurement
+    records = full_records(frames[:1])
+    sink = h2m_recording_sink(keep=False)
+
+    def announce(record):
+        helper = h2m_helper(sink, logging.WARNING, discovery=discovery, discovery_cleanup=False)
+        helper.announce_new("HSV30", "Lambdatronic", record)
+    result = measure(announce, records, max(1, repeat // 50))
+    sink.bytes = 0
+    sink.count = 0
+    announce(records[0])
+    result["payload_bytes"] = sink.bytes
+    result["messages"] = sink.count
+    return result
+
+def bench_announce_device(frames, repeat):
+    return bench_announce(frames, repeat, discovery="device")
+
+def bench_alarms(frames, repeat):
+    # the default rules of hargassner2mqtt.py, on the records of the serial and the voltage parser
+    from h2mAlarms import h2m_alarms, h2m_alarm_rule
+    rules = [
+        {"name": "druck_niedrig", "field": "heizungsdruck", "below": 1.0, "hysteresis": 0.1, "for": 10},
+        {"name": "druck_abfall", "field": "heizungsdruck", "rate_window": 60, "below": -0.1},
+        {"name": "stoerung", "field": "stoerung", "equals": [True]},
+        {"name": "o2_ausserhalb", "field": "o2_im_rauchgas", "below": 4.0, "above": 14.0, "for": 300, "when": {"field": "status", "equals": [14]}},
+        {"name": "zuendung_ohne_temperaturanstieg", "field": "temperatur_rauchgas", "rate_window": 300, "below": 2.0, "for": 300, "when": {"field": "status", "equals": [7, 9, 10]}},
+    ]
+    serial_parser = h2m_serial_parser(logging.ERROR)
+    voltage_parser = h2m_voltage_parser(logging.ERROR)
+    records = []
+    for i, frame in enumerate(frames):
+        parsed_serial_input, valid = serial_parser.parse(frame)
+        if valid:
+            # a frame every 0.5s, the pressure slowly falling and rising again
+            records.append((i * 0.5, parsed_serial_input, voltage_parser.parse(1.5 + 0.3 * ((i % 400) - 200) / 200)[0]))
+    alarms = h2m_alarms(logging.ERROR, [h2m_alarm_rule.from_config(rule) for rule in rules])
+    return measure(lambda record: alarms.update(*record), records, repeat)
+
+def bench_bit_events(frames, repeat):
+    # XOR of the register words against the previous frame, ns per frame
+    from h2mEvents import h2m_bit_events
+    parser = h2m_serial_parser(logging.ERROR)
+    columns = []
+    for frame in frames:
+        if parser.parse(frame)[1]:
+            columns.append(parser.columns)
+    events = h2m_bit_events(logging.ERROR)
+    result = measure(events.update, columns, repeat)
+    result["changes_per_frame"] = round(events.changes / events.frames, 3)
+    return result
+
+def bench_replay(frames, repeat):
+    # best of several runs, a single pass over the corpus is too short for a stable number
+    best = None
+    for _ in range(5):
+        sink = h2m_recording_sink(keep=False)
+        start = time.perf_counter_ns()
+        stats = replay(frames, sink, logging.ERROR)
+        ns = (time.perf_counter_ns() - start) / stats["frames"]
+        if best is None or ns < best[0]:
+            best = (ns, stats, sink.bytes)
+    ns, stats, payload_bytes = best
+    return {
+        "ns_per_op": round(ns),
+        "frames_per_second": stats["frames_per_second"],
+        "publishes_per_second": stats["publishes_per_second"],
+        "payload_bytes": payload_bytes,
+    }
+
+STARTUP_SCRIPT = """
+import time
+start = time.perf_counter_ns()
+from h2mReplay import replay, h2m_recording_sink
+imported = time.perf_counter_ns()
+class first_publish_sink(h2m_recording_sink):
+    def __call__(self, topic, payload, qos=1, retain=False, coalesce=True, on_sent=None):
+        if not retain and self.retained and not hasattr(self, "first"):
+            self.first = time.perf_counter_ns()
+        super().__call__(topic, payload, qos=qos, retain=retain, coalesce=coalesce, on_sent=on_sent)
+sink = first_publish_sink(keep=False)
+replay([FRAME], sink, 40)
+print(imported - start, sink.first - start)
+"""
+
+def bench_startup(frames, repeat):
+    # fresh interpreter: imports, bridge construction and the first frame until its state is published
+    script = STARTUP_SCRIPT.replace("FRAME", repr(SAMPLE_FRAME))
+    runs = []
+    for _ in range(5):
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        runs.append([int(value) for value in output.stdout.split()])
+    imported, published = min(runs, key=lambda run: run[1])
+    return {
+        "ns_per_op": published,
+        "import_ns": imported,
+    }
+
+BENCHMARKS = {
+    "tokenize": bench_tokenize,
+    "serial_parse": bench_serial_parse,
+    "voltage_parse": bench_voltage_parse,
+    "helper_send": bench_send,
+    "helper_send_typed": bench_send_typed,
+    "announce_cold": bench_announce,
+    "announce_device": bench_announce_device,
+    "alarms": bench_alarms,
+    "bit_events": bench_bit_events,
+    "replay": bench_replay,
+    "startup": bench_startup,
+}
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            base = baseline.get(name, {}).get(metric)
+            if not base:
+                continue
+            change = (value - base) / abs(base)
+            if metric in HIGHER_IS_BETTER:
+                change = -change
+            if change > tolerance:
+                regressions.append(f"{name}.{metric}: {base} -> {value} ({change:+.0%})")
+    return regressions
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("benchmarks", nargs="*", help=f"benchmarks to run, default all of: {', '.join(BENCHMARKS)}")
+    arg_parser.add_argument("--repeat", type=int, default=20000, help="operations timed per benchmark")
+    arg_parser.add_argument("--corpus", default=CORPUS, help="frames in h2mReplay.py format")
+    arg_parser.add_argument("--write-corpus", action="store_true", help="(re)generate the synthetic corpus and exit")
+    arg_parser.add_argument("--save", nargs="?", const=BASELINE, help="save the results as baseline")
+    arg_parser.add_argument("--compare", nargs="?", const=BASELINE, help="compare the results against a baseline")
+    arg_parser.add_argument("--tolerance", type=float, default=0.25, help="relative change reported as regression")
+    args = arg_parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+
+    if args.write_corpus:
+        write_corpus(args.corpus)
+        sys.exit(0)
+
+    frames = load_corpus(args.corpus)
+    results = {}
+    for name in args.benchmarks or BENCHMARKS:
+        results[name] = BENCHMARKS[name](frames, args.repeat)
+        print(f"{name}: " + ", ".join(f"{metric}={value}" for metric, value in results[name].items()))
+
+    if args.save:
+        with open(args.save, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+            baseline_file.write("\n")
+        print(f"Saved baseline to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regression against {args.compare}")
@@ -0,0 +1,116 @@
+from h2mBridge import h2m_bridge
+from h2mSerialReader import h2m_serial_reader
+from h2mMetrics import h2m_metrics
+import logging
+import threading
+import time
+
+logging.basicConfig(
+    format='[%(asctime)s] %(levelname)-2s %(message)s',
+    level=logging.INFO,
+    datefmt='%H:%M:%S')
+
+class h2m_boiler():
+    """One boiler of the process: its serial port, reader and bridge, processed in its own thread.
+
+    open_port() returns the opened serial port, it is retried with backoff inside the thread
+    and the port is opened again after reopen_after seconds without frames. A missing or
+    dead port only stalls its own boiler, the helper, sinks and ADC sampler are shared.
+    The frames are processed every poll_interval seconds whatever the publish mode, so
+    mode switches and alarms are not delayed by a long window.
+    """
+    def __init__(self, name, open_port, helper, loglevel, voltage_source=None, metrics=None, poll_interval=0.5, buffer_size=120, reopen_after=60.0, no_frames_after=5.0, **bridge_args) -> None:
+        logging.getLogger().setLevel(loglevel)
+        self.name = name
+        self.open_port = open_port
+        self.loglevel = loglevel
+        self.metrics = metrics if metrics is not None else h2m_metrics(loglevel)
+        self.poll_interval = poll_interval
+        self.buffer_size = buffer_size
+        self.reopen_after = reopen_after
+        self.no_frames_after = no_frames_after
+        self.bridge = h2m_bridge(helper, voltage_source, loglevel, system_name=name, metrics=self.metrics, **bridge_args)
+        self.port = None
+        self.reader = None
+        self.last_frames = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+        # counters
+        self.port_opens = 0
+        self.errors = 0
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.__run, name=f"h2m-boiler-{self.name}", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5.0):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join(timeout=timeout)
+            self.thread = None
+        self.__close()
+
+    def __open(self):
+        delay = 0.1
+        while not self.stopped.is_set():
+            try:
+                self.port = self.open_port()
+                break
+            except Exception as e:
+                self.metrics.warn("serial_open", f"Opening the serial port failed: {e}")
+                self.stopped.wait(delay)
+                delay = min(delay * 2, 5.0)
+        if self.port is None:
+            return
+        self.port_opens += 1
+        self.reader = h2m_serial_reader(self.port, self.loglevel, capacity=self.buffer_size, metrics=self.metrics)
+        self.reader.start()
+        self.last_frames = time.monotonic()
+        logging.info(f"Boiler {self.name} reading from {self.port.name}")
+
+    def __close(self):
+        if self.reader is not None:
+            self.reader.stop()
+            self.reader = None
+        if self.port is not None:
+            try:
+                self.port.close()
+            except Exception as e:
+                logging.debug(f"Closing the serial port of {self.name} failed: {e}")
+            self.port = None
+
+    def __run(self):
+        while not self.stopped.is_set():
+            if self.reader is None:
+                self.__open()
+                continue
+            # poll quickly until the first frame is published
+            self.stopped.wait(self.poll_interval if self.bridge.publishes > 0 else 0.1)
+
+            try:
+                frames = self.reader.take()
+                if len(frames) == 0:
+                    silent = time.monotonic() - self.last_frames
+                    if self.bridge.publishes > 0 and silent >= self.no_frames_after:
+                        self.metrics.warn("no_frames", f"no serial frames received within {self.no_frames_after}s")
+                    if silent >= self.reopen_after:
+                        self.metrics.warn("serial_reopen", f"no serial frames for {self.reopen_after}s, reopening the port")
+                        self.__close()
+                    continue
+                self.last_frames = time.monotonic()
+                self.bridge.process(frames)
+                logging.debug(f"{self.name} bridge: {self.bridge.stats()}")
+            except Exception as e:
+                self.errors += 1
+                logging.error(f"{self.name}: {e}")
+
+    def stats(self):
+        stats = {"port_open": self.port is not None, "port_opens": self.port_opens, "errors": self.errors}
+        if self.reader is not None:
+            stats.update(self.reader.stats())
+        stats.update(self.bridge.stats())
+        return stats
@@ -0,0 +1,205 @@
+from h2mHelper import h2m_field, h2m_record, FieldType, STATE_PREFIX
+from h2mSerialParser import h2m_serial_parser
+from h2mVoltageParser import h2m_voltage_parser
+from h2mAggregator import h2m_aggregator
+from h2mMetrics import h2m_metrics
+import datetime
+import json
+import logging
+import time
+
+logging.basicConfig(
+    format='[%(asctime)s] %(levelname)-2s %(message)s',
+    level=logging.INFO,
+    datefmt='%H:%M:%S')
+
+# Diagnostic values added to every published frame
+BRIDGE_FIELDS = (
+    h2m_field("raw_data_serial", "Raw Serial Data", enabled=False, category="diagnostic", trigger=False),
+    h2m_field("last_seen", "Last Seen", category="diagnostic", icon="mdi:clock", device_clazz="timestamp", trigger=False),
+)
+
+# Diagnostic values added to every published frame if a scheduler is configured
+SCHEDULER_FIELDS = (
+    h2m_field("publish_mode", "Publish Mode", category="diagnostic", icon="mdi:speedometer", trigger=False),
+)
+
+# Diagnostic values added to every published frame if an ADC is configured
+VOLTAGE_FIELDS = (
+    h2m_field("raw_data_voltage", "Raw Voltage Data", enabled=False, category="diagnostic", device_clazz="voltage", unit="V", field_type=FieldType.FLOAT, trigger=False),
+)
+
+class h2m_bridge():
+    """Pipeline of one boiler: parse serial frames, aggregate them, add the pressure and send.
+
+    Frames are objects with `line`, `monotonic` and `wall` attributes, see h2m_frame.
+    voltage_source is called once per aggregated window and returns the ADC voltage,
+    without voltage_source the pressure fields are left out. With a h2m_scheduler the
+    aggregation window and heartbeat follow the boiler status, a mode transition
+    publishes the incomplete window of the old mode and then the transition frame.
+    With a h2m_archive_writer every frame is archived with the current voltage. h2m_alarms
+    are evaluated on every frame, raised and cleared alarms are published at once to the
+    alarm topic (never coalesced) and their states are added to the state payload. With
+    h2m_bit_events the bit fields of the registers are left out of the state payload,
+    their transitions are published per frame to the events topic instead. The sinks of
+    the helper get every valid frame with the voltage, before it is aggregated.
+    """
+    def __init__(self, helper, voltage_source, loglevel, system_name="HSV30", sensor_name="Lambdatronic", aggregation_window=20, aggregation_extra_entities=False, counters=None, scheduler=None, archive=None, alarms=None, events=None, metrics=None) -> None:
+        logging.getLogger().setLevel(loglevel)
+        self.metrics = metrics if metrics is not None else h2m_metrics(loglevel)
+        self.h2m = helper
+        self.voltage_source = voltage_source
+        self.system_name = system_name
+        self.sensor_name = sensor_name
+        self.serial_parser = h2m_serial_parser(loglevel)
+        self.voltage_parser = h2m_voltage_parser(loglevel)
+        self.aggregator = h2m_aggregator(loglevel, window=aggregation_window, extra_entities=aggregation_extra_entities)
+        self.counters = counters
+        self.scheduler = scheduler
+        self.archive = archive
+        self.alarms = alarms
+        self.events = events
+        self.events_published = 0
+        self.alarm_topic = f"{STATE_PREFIX}/{helper.sanitize(system_name)}/alarms"
+        self.previous_frame = None
+        # fields of the per frame records of the sinks, built once per schema
+        self.frame_schema = None
+        self.frame_fields = None
+        if scheduler is not None:
+            self.aggregator.window = scheduler.mode.window
+
+        # counters
+        self.frames_valid = 0
+        self.frames_invalid = 0
+        self.sends = 0
+        self.publishes = 0
+
+    def process(self, frames):
+        metrics = self.metrics
+        # the filtered voltage changes slowly, it is read once per batch of frames
+        voltage = None
+        parsed_voltage = None
+        if self.voltage_source is not None and (self.archive is not None or self.alarms is not None or self.h2m.sinks):
+            voltage = self.voltage_source()
+            parsed_voltage, voltage_data_valid = self.voltage_parser.parse(voltage)
+            if not voltage_data_valid:
+                parsed_voltage = None
+        for frame in frames:
+            if self.archive is not None:
+                self.archive.add(frame, voltage)
+            start = time.perf_counter()
+            parsed_serial_input, serial_data_valid = self.serial_parser.parse(frame.line)
+            metrics.observe("h2m_stage_seconds", time.perf_counter() - start, stage="parse")
+            if not serial_data_valid:
+                self.frames_invalid += 1
+                metrics.inc("h2m_frames_invalid_total", reason=self.serial_parser.last_error)
+                metrics.warn(f"frame_{self.serial_parser.last_error}", f"Invalid serial frame ({self.serial_parser.last_error}): {frame.text()}")
+                continue
+            self.frames_valid += 1
+            metrics.inc("h2m_frames_valid_total")
+            if self.counters is not None:
+                self.counters.add(parsed_serial_input, frame.monotonic)
+            if self.scheduler is not None:
+                previous_mode = self.scheduler.update(parsed_serial_input, frame.monotonic)
+                if previous_mode is not None:
+                    self.__switch_mode(previous_mode)
+
+            if self.alarms is not None:
+                if parsed_voltage is not None:
+                    changed = self.alarms.update(frame.monotonic, parsed_serial_input, parsed_voltage)
+                else:
+                    changed = self.alarms.update(frame.monotonic, parsed_serial_input)
+                if changed:
+                    self.__publish_alarms(frame, changed)
+
+            if self.events is not None:
+                changed = self.events.update(self.serial_parser.columns)
+                if changed:
+                    self.__send_events(frame, changed)
+
+            if self.h2m.sinks:
+                self.h2m.record(self.system_name, self.sensor_name, self.__frame_record(parsed_serial_input, voltage, parsed_voltage), wall=frame.wall)
+
+            aggregated_serial_input = self.aggregator.add(parsed_serial_input)
+            self.previous_frame = frame
+            if aggregated_serial_input is not None:
+                self.send(frame, aggregated_serial_input)
+
+    def __frame_record(self, parsed_serial_input, voltage, parsed_voltage):
+        # every frame with the voltage of its batch, the fields tuple is kept while the schemas do not change
+        if parsed_voltage is None:
+            return parsed_serial_input
+        if self.frame_schema is None or self.frame_schema[0] is not parsed_serial_input.fields or self.frame_schema[1] is not parsed_voltage.fields:
+            self.frame_schema = (parsed_serial_input.fields, parsed_voltage.fields)
+            self.frame_fields = parsed_serial_input.fields + VOLTAGE_FIELDS + parsed_voltage.fields
+        return h2m_record(self.frame_fields, parsed_serial_input.values + [voltage] + parsed_voltage.values)
+
+    def __publish_alarms(self, frame, changed):
+        timestamp = datetime.datetime.fromtimestamp(frame.wall, datetime.UTC).isoformat()
+        for rule in changed:
+            (logging.warning if rule.active else logging.info)(f"Alarm {rule.name} {'raised' if rule.active else 'cleared'}: {rule.condition.field}={rule.condition.value}")
+            self.metrics.inc("h2m_alarms_total", alarm=rule.name, state="raised" if rule.active else "cleared")
+            self.h2m.transmit_callback(self.alarm_topic, json.dumps({
+                "alarm": rule.name,
+                "name": rule.visible_name,
+                "active": rule.active,
+                "severity": rule.severity,
+                "field": rule.condition.field,
+                "value": rule.condition.value,
+                "time": timestamp,
+            }), qos=1, retain=False, coalesce=False)
+
+    def __send_events(self, frame, changed):
+        if self.h2m.send_events(self.system_name, self.sensor_name, self.events.record(), changed, now=frame.monotonic, wall=frame.wall):
+            self.events_published += 1
+
+    def __switch_mode(self, previous_mode):
+        # the incomplete window still belongs to the previous mode
+        aggregated_serial_input = self.aggregator.flush()
+        if aggregated_serial_input is not None:
+            self.send(self.previous_frame, aggregated_serial_input, mode=previous_mode)
+        self.aggregator.window = self.scheduler.mode.window
+        self.aggregator.publish_first = True
+
+    def send(self, frame, parsed_serial_input, mode=None):
+        if self.events is not None:
+            parsed_serial_input = self.events.strip(parsed_serial_input)
+            # unchanged bits only publish when all of them are due again
+            self.__send_events(frame, ())
+        data = h2m_record(BRIDGE_FIELDS, [
+            frame.text(),
+            datetime.datetime.fromtimestamp(frame.wall, datetime.UTC).replace(microsecond=0).isoformat()
+        ]) + parsed_serial_input
+        if self.counters is not None:
+            data = data + self.counters.record()
+        if self.alarms is not None:
+            data = data + self.alarms.record()
+        max_interval = None
+        if self.scheduler is not None:
+            mode = mode if mode is not None else self.scheduler.mode
+            data = data + h2m_record(SCHEDULER_FIELDS, [mode.name])
+            max_interval = mode.max_interval
+
+        if self.voltage_source is not None:
+            voltage = self.voltage_source()
+            parsed_voltage, voltage_data_valid = self.voltage_parser.parse(voltage)
+            if not voltage_data_valid:
+                self.metrics.warn("voltage", f"Invalid voltage: {voltage}")
+                return False
+            data = data + h2m_record(VOLTAGE_FIELDS, [voltage]) + parsed_voltage
+
+        self.sends += 1
+        with self.metrics.time("h2m_stage_seconds", stage="send"):
+            published = self.h2m.send(self.system_name, self.sensor_name, data, now=frame.monotonic, max_interval=max_interval, wall=frame.wall)
+        if published:
+            self.publishes += 1
+        return published
+
+    def stats(self):
+        return {
+            "frames_valid": self.frames_valid,
+            "frames_invalid": self.frames_invalid,
+            "sends": self.sends,
+            "publishes": self.publishes,
+            "events_published": self.events_published,
+        }
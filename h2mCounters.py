@@ -0,0 +1,154 @@
+from h2mHelper import h2m_field, h2m_record, FieldType
+import json
+import logging
+import os
+
+logging.basicConfig(
+    format='[%(asctime)s] %(levelname)-2s %(message)s',
+    level=logging.INFO,
+    datefmt='%H:%M:%S')
+
+class h2m_counter():
+    """A counter derived from a field of every frame.
+
+    kind "runtime" integrates the hours the source is active, "starts" counts its rising
+    edges and "integral" integrates the value over time, multiplied by factor per hour.
+    The source is active when it equals `equals`, or when it is true without `equals`.
+    """
+    __slots__ = ("meta", "source", "kind", "equals", "factor")
+
+    def __init__(self, meta, source, kind, equals=None, factor=1.0) -> None:
+        if kind not in ("runtime", "starts", "integral"):
+            raise ValueError(f"unknown counter kind: {kind}")
+        self.meta = meta
+        self.source = source
+        self.kind = kind
+        self.equals = equals
+        self.factor = factor
+
+def runtime(field, visible_name, source, equals=None, enabled=True):
+    return h2m_counter(h2m_field(field, visible_name, field_type=FieldType.FLOAT, device_clazz="duration", state_clazz="total_increasing", unit="h", icon="mdi:timer-outline", enabled=enabled, deadband=(0.01, 0.0)), source, "runtime", equals=equals)
+
+def starts(field, visible_name, source, equals=None, enabled=True):
+    return h2m_counter(h2m_field(field, visible_name, field_type=FieldType.INT, state_clazz="total_increasing", icon="mdi:counter", enabled=enabled), source, "starts", equals=equals)
+
+# Fördermenge is the feed rate in % of the maximum, kg_per_hour is the pellet feed at 100%
+def fuel(kg_per_hour):
+    return h2m_counter(h2m_field("brennstoffverbrauch", "Brennstoffverbrauch (geschätzt)", field_type=FieldType.FLOAT, device_clazz="weight", state_clazz="total_increasing", unit="kg", icon="mdi:pine-tree-fire", deadband=(0.1, 0.0)), "foerdermenge", "integral", factor=kg_per_hour / 100.0)
+
+DEFAULT_COUNTERS = (
+    runtime("brenner_laufzeit", "Brenner Laufzeit", "status", equals=14),
+    starts("zuendungen", "Zündungen", "zuendung_heizung"),
+    starts("entaschungen", "Entaschungen", "status", equals=18),
+    runtime("einschubschnecke_laufzeit", "Einschubschnecke Laufzeit", "einschubschnecke_vorwaerts", enabled=False),
+    starts("einschubschnecke_starts", "Einschubschnecke Starts", "einschubschnecke_vorwaerts", enabled=False),
+    runtime("pumpe_heizkreis_1_laufzeit", "Pumpe Heizkreis 1 Laufzeit", "pumpe_heizkreis_1", enabled=False),
+    runtime("pumpe_heizkreis_2_laufzeit", "Pumpe Heizkreis 2 Laufzeit", "pumpe_heizkreis_2", enabled=False),
+    runtime("pumpe_boiler_laufzeit", "Pumpe Boiler Laufzeit", "pumpe_boiler", enabled=False),
+)
+
+class h2m_counters():
+    """Accumulates runtimes, rising edges and integrals over every frame.
+
+    The totals are checkpointed to a JSON file, so a restart continues the counters instead
+    of resetting them. Gaps between frames longer than max_gap seconds are not integrated.
+    """
+    def __init__(self, loglevel, counters=DEFAULT_COUNTERS, path=None, checkpoint_interval=300.0, max_gap=5.0) -> None:
+        logging.getLogger().setLevel(loglevel)
+        self.counters = counters
+        self.fields = tuple(counter.meta for counter in counters)
+        self.totals = [0 if counter.kind == "starts" else 0.0 for counter in counters]
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+        self.max_gap = max_gap
+        self.schema = None
+        self.sources = None
+        self.previous_active = [None] * len(counters)
+        self.previous_time = None
+        self.previous_values = None
+        self.last_checkpoint = None
+        self.load()
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as checkpoint:
+                saved = json.load(checkpoint)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Counter checkpoint {self.path} not readable: {e}")
+            return
+        for i, counter in enumerate(self.counters):
+            self.totals[i] = saved.get(counter.meta.field, self.totals[i])
+        logging.info(f"Loaded counters from {self.path}")
+
+    def checkpoint(self):
+        if self.path is None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as checkpoint:
+            json.dump({counter.meta.field: total for counter, total in zip(self.counters, self.totals)}, checkpoint)
+            checkpoint.flush()
+            os.fsync(checkpoint.fileno())
+        os.replace(temporary, self.path)
+        logging.debug(f"Saved counters to {self.path}")
+
+    def __setup(self, fields):
+        names = {meta.field: i for i, meta in enumerate(fields)}
+        self.schema = fields
+        self.sources = [names.get(counter.source) for counter in self.counters]
+        for counter, source in zip(self.counters, self.sources):
+            if source is None:
+                logging.warning(f"Counter {counter.meta.field}: unknown field {counter.source}")
+
+    def __active(self, counter, value):
+        if counter.equals is not None:
+            return value == counter.equals
+        return bool(value)
+
+    def add(self, record, now):
+        """Account the record of one frame captured at monotonic time now."""
+        if record.fields is not self.schema:
+            self.__setup(record.fields)
+        values = record.values
+        elapsed = None
+        if self.previous_time is not None:
+            elapsed = now - self.previous_time
+            if elapsed < 0 or elapsed > self.max_gap:
+                elapsed = None
+
+        for i, counter in enumerate(self.counters):
+            source = self.sources[i]
+            if source is None:
+                continue
+            value = values[source]
+            if counter.kind == "integral":
+                # trapezoid between the previous and the current frame
+                if elapsed is not None:
+                    previous = self.previous_values[source]
+                    self.totals[i] += (previous + value) / 2 * elapsed / 3600.0 * counter.factor
+                continue
+            active = self.__active(counter, value)
+            if counter.kind == "runtime":
+                if elapsed is not None and self.previous_active[i]:
+                    self.totals[i] += elapsed / 3600.0
+            elif active and self.previous_active[i] is False:
+                self.totals[i] += 1
+            self.previous_active[i] = active
+
+        self.previous_time = now
+        self.previous_values = values
+        if self.last_checkpoint is None:
+            self.last_checkpoint = now
+        elif now - self.last_checkpoint >= self.checkpoint_interval:
+            self.last_checkpoint = now
+            self.checkpoint()
+
+    def record(self):
+        values = []
+        for counter, total in zip(self.counters, self.totals):
+            values.append(total if counter.kind == "starts" else round(total, 3))
+        return h2m_record(self.fields, values)
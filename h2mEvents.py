@@ -0,0 +1,89 @@
+from h2mHelper import h2m_record
+from h2mSerialParser import SCHEMA, registers_of
+import logging
+
+logging.basicConfig(
+    format='[%(asctime)s] %(levelname)-2s %(message)s',
+    level=logging.INFO,
+    datefmt='%H:%M:%S')
+
+class h2m_bit_events():
+    """Transitions of the bit fields of the hex register columns, frame by frame.
+
+    Every register word is compared to the previous one with XOR, an unchanged word costs
+    one int() and one comparison. The set bits of the difference are looked up in a table
+    of the fields using that bit, only fields whose value changed are reported.
+    """
+    def __init__(self, loglevel, schema=SCHEMA) -> None:
+        logging.getLogger().setLevel(loglevel)
+        self.registers = registers_of(schema)
+        self.fields = tuple(meta for register in self.registers for meta in register.fields)
+        # per register: column, mask, {bit: ((position, mask, invert), ...)}
+        self.tables = []
+        position = 0
+        for register in self.registers:
+            table = {}
+            for mask, invert in register.bits:
+                bit = 1
+                while bit <= mask:
+                    if mask & bit:
+                        table.setdefault(bit, []).append((position, mask, invert))
+                    bit <<= 1
+                position += 1
+            self.tables.append((register.column, register.mask, {bit: tuple(entries) for bit, entries in table.items()}))
+        self.words = None
+        self.values = None
+        self.strip_schema = None
+        self.strip_indexes = None
+        self.strip_fields = None
+
+        # counters
+        self.frames = 0
+        self.changes = 0
+
+    def update(self, columns):
+        """Compare the split columns of a valid frame to the previous one, returns the positions of the changed fields.
+
+        The first frame sets the reference words and reports every field.
+        """
+        self.frames += 1
+        words = [int(columns[column], 16) & mask for column, mask, _ in self.tables]
+        if self.words is None:
+            self.words = words
+            self.values = [value for register, word in zip(self.registers, words) for value in register.decode(word)]
+            return tuple(range(len(self.fields)))
+
+        changed = []
+        for (_, _, table), previous, word in zip(self.tables, self.words, words):
+            difference = previous ^ word
+            while difference:
+                bit = difference & -difference
+                difference ^= bit
+                for position, mask, invert in table[bit]:
+                    value = (word & mask != 0) != invert
+                    if value != self.values[position]:
+                        self.values[position] = value
+                        changed.append(position)
+        self.words = words
+        self.changes += len(changed)
+        return changed
+
+    def record(self):
+        """The current value of every bit field, a copy as sinks keep it."""
+        return h2m_record(self.fields, list(self.values))
+
+    def strip(self, record):
+        """record without the bit fields, they are published as events instead."""
+        if record.fields is not self.strip_schema:
+            bits = frozenset(self.fields)
+            self.strip_schema = record.fields
+            self.strip_indexes = tuple(i for i, meta in enumerate(record.fields) if meta not in bits)
+            self.strip_fields = tuple(record.fields[i] for i in self.strip_indexes)
+        values = record.values
+        return h2m_record(self.strip_fields, [values[i] for i in self.strip_indexes])
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "changes": self.changes,
+        }
@@ -1,22 +1,94 @@
 from enum import Enum
+import datetime
+import hashlib
 import json
 import logging
 import re
+import threading
+import time
+
+# optional, faster encoder of the typed state payloads
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 VERSION = "0.1"
 HA_PREFIX = "homeassistant"
+HA_STATUS_TOPIC = f"{HA_PREFIX}/status"
 STATE_PREFIX = "hargassner"
 
+# "string": every state value as JSON string, "typed": JSON numbers and booleans
+PAYLOAD_MODES = ("string", "typed")
+
+# "entity": one retained config per measurement, "device": one device config with all measurements as components
+DISCOVERY_MODES = ("entity", "device")
+
+# Seconds after which a measurement is published again even if it did not change
+DEFAULT_MAX_INTERVAL = 300
+
 logging.basicConfig(
     format='[%(asctime)s] %(levelname)-2s %(message)s',
     level=logging.INFO,
     datefmt='%H:%M:%S')
 
 class h2m_helper():
-    def __init__(self, transmit_callback, loglevel) -> None:
+    def __init__(self, transmit_callback, loglevel, deadbands=None, field_deadbands=None, max_interval=DEFAULT_MAX_INTERVAL, sinks=(), discovery="entity", discovery_cleanup=True, discovery_marker=None, payload="string") -> None:
         logging.getLogger().setLevel(loglevel)
         self.systems = {}
         self.transmit_callback = transmit_callback
+        # the bridges of several boilers send from their own threads
+        self.lock = threading.RLock()
+        self.announce_requested = False
+        # (absolute, relative) deadbands per FieldType and per field name, fields without one publish on any change
+        self.deadbands = dict(DEFAULT_DEADBANDS)
+        self.deadbands.update(deadbands or {})
+        self.field_deadbands = dict(field_deadbands or {})
+        self.max_interval = max_interval
+        # further outputs besides MQTT, every h2m_sink gets the record of each frame passed to record()
+        self.sinks = tuple(sinks)
+        if discovery not in DISCOVERY_MODES:
+            raise ValueError(f"unknown discovery mode: {discovery}")
+        self.discovery = discovery
+        # remove the retained configs of the other discovery mode once after a mode switch: the empty
+        # configs are sent again with every requested announce until the client accepted all of them,
+        # then the mode is written to the discovery_marker file and no cleanup is sent any more
+        self.discovery_marker = discovery_marker
+        if discovery_cleanup and discovery_marker is not None and self.__read_marker() == discovery:
+            discovery_cleanup = False
+        self.discovery_cleanup = discovery_cleanup
+        if payload not in PAYLOAD_MODES:
+            raise ValueError(f"unknown payload mode: {payload}")
+        self.payload = payload
+
+    def __read_marker(self):
+        try:
+            with open(self.discovery_marker) as marker:
+                return marker.read().strip()
+        except OSError:
+            return None
+
+    def clear_retained(self, topic, cleared):
+        """Send an empty retained config of the other discovery mode, cleared() is called when the client accepted it."""
+        self.transmit_callback(topic, "", retain=True, on_sent=cleared)
+
+    def cleanup_done(self):
+        # called from the publisher thread for every accepted cleanup
+        with self.lock:
+            if not self.discovery_cleanup:
+                return
+            for current_system in self.systems.values():
+                for current_sensor in current_system.sensors.values():
+                    if not current_sensor.cleanup_done():
+                        return
+            self.discovery_cleanup = False
+            logging.info(f"Removed the discovery configs of the other mode than {self.discovery}")
+            if self.discovery_marker is not None:
+                try:
+                    with open(self.discovery_marker, "w") as marker:
+                        marker.write(self.discovery)
+                except OSError as e:
+                    logging.warning(f"Writing {self.discovery_marker} failed: {e}")
 
     def sanitize(self, value):
         return re.sub("[^a-zA-Z0-9_-]", "_", value).lower()
@@ -24,30 +96,117 @@ class h2m_helper():
     def __get_measurements_list(self, json_data):
         return json_data.keys()
 
-    def announce_new(self, system_name, sensor_name, parsed_values):
+    def announce_new(self, system_name, sensor_name, parsed_values, events=False):
         # Add current host if unknown
         current_system, is_new_h = self.add_system(system_name)
         # Add unknown sensors to host
         current_sensor, is_new_s = current_system.add_sensor(sensor_name)
         # Add unknown measurements to each sensor
-        for parsed_value in parsed_values:
-            _, is_new_m = current_sensor.add_measurement(parsed_value)
+        is_new_m = False
+        measurements = []
+        for meta in parsed_values.fields:
+            current_measurement, is_new = current_sensor.add_measurement(meta, events)
+            measurements.append(current_measurement)
+            is_new_m |= is_new
 
         if is_new_s and current_sensor.enabled:
             logging.debug(f"Added sensor: {current_sensor.topic}")
+        if current_sensor.device_pending:
+            current_sensor.announce_device()
+
+        return (is_new_s | is_new_h | is_new_m), current_sensor, measurements
+
+    def request_announce(self):
+        # Called from the mqtt network thread on (re)connect or when home assistant comes online,
+        # the announcement itself is sent with the next call to send().
+        self.announce_requested = True
 
-        return (is_new_s | is_new_h | is_new_m), current_sensor
+    def announce(self):
+        with self.lock:
+            self.announce_requested = False
+            for current_system in self.systems.values():
+                current_system.announce()
+
+    def send(self, system_name, sensor_name, parsed_values, now=None, max_interval=None, wall=None):
+        """Publish the state of a sensor if any measurement moved past its deadband or its heartbeat expired.
+
+        max_interval overrides the default heartbeat of this send, field specific heartbeats are kept.
+        """
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            return self.__send(system_name, sensor_name, h2m_record.of(parsed_values), now, max_interval, wall)
 
-    def send(self, system_name, sensor_name, parsed_values):
-        is_new, current_sensor = self.announce_new(system_name, sensor_name, parsed_values)
+    def record(self, system_name, sensor_name, parsed_values, wall=None):
+        """Pass the record of one frame to the sinks, independent of aggregation and deadbands."""
+        for sink in self.sinks:
+            sink.put(system_name, sensor_name, parsed_values, wall)
+
+    def __send(self, system_name, sensor_name, parsed_values, now, max_interval, wall):
+        is_new, current_sensor, measurements = self.announce_new(system_name, sensor_name, parsed_values)
+        if self.announce_requested:
+            self.announce()
 
         if current_sensor.enabled:
-            json_data = {}
-            for parsed_value in parsed_values:
-                json_data[f"{parsed_value.field}"] = f"{parsed_value.value}"
+            due = False
+            for current_measurement, value in zip(measurements, parsed_values.values):
+                if current_measurement.is_due(value, now, max_interval):
+                    due = True
+                    break
+            if not due:
+                logging.debug(f"No measurement of {current_sensor.topic} changed")
+                return False
+
+            for current_measurement, value in zip(measurements, parsed_values.values):
+                current_measurement.published(value, now)
+
+            self.transmit_callback(current_sensor.topic, current_sensor.encode_state(parsed_values), qos=0, retain=False)
+            return True
+        return False
+
+    def send_events(self, system_name, sensor_name, parsed_values, changed, now=None, wall=None):
+        """Publish the changed values of one frame as one event to the events topic of the sensor.
+
+        changed are the positions in parsed_values. An event only holds its changes, it is
+        published with coalesce=False so a later event never replaces it. The measurements
+        take their state from the events, so the first event, the first after an announce
+        and the first after max_interval carry all values.
+        """
+        if now is None:
+            now = time.monotonic()
+        if wall is None:
+            wall = time.time()
+        with self.lock:
+            is_new, current_sensor, measurements = self.announce_new(system_name, sensor_name, parsed_values, events=True)
+            if self.announce_requested:
+                self.announce()
+            if not current_sensor.enabled:
+                return False
+
+            snapshot = current_sensor.events_snapshot or current_sensor.events_published is None or now - current_sensor.events_published >= self.max_interval
+            if snapshot:
+                changed = range(len(parsed_values))
+                current_sensor.events_snapshot = False
+                current_sensor.events_published = now
+            elif not changed:
+                return False
+            event = {"time": datetime.datetime.fromtimestamp(wall, datetime.UTC).isoformat(timespec="milliseconds")}
+            if snapshot:
+                event["snapshot"] = True
+            fields = parsed_values.fields
+            values = parsed_values.values
+            for position in changed:
+                event[fields[position].field] = values[position]
+            self.transmit_callback(current_sensor.event_topic, orjson.dumps(event) if orjson is not None else STATE_ENCODER.encode(event), qos=1, retain=False, coalesce=False)
+            return True
 
-            # current_sensor.announce()
-            self.transmit_callback(f"{current_sensor.topic}", json.dumps(json_data), qos=0, retain=False)
+    def get_deadband(self, meta):
+        if meta.deadband is not None:
+            return meta.deadband
+        deadband = self.field_deadbands.get(meta.field)
+        if deadband is not None:
+            return deadband
+        return self.deadbands.get(meta.field_type)
 
     def add_system(self, system_name):
         system_id = self.sanitize(system_name)
@@ -65,10 +224,17 @@ class FieldType(Enum):
     INT = 3
     BOOL = 4
 
-class h2m_data():
-    def __init__(self, field, value, visible_name, field_type=FieldType.STR, device_clazz=None, state_clazz=None, unit=None, icon=None, enabled=True, category=None) -> None:
+# (absolute, relative) change needed before a value is published again
+DEFAULT_DEADBANDS = {
+    FieldType.FLOAT: (0.5, 0.0),
+}
+
+class h2m_field():
+    """Static description of a measurement, shared by reference by all of its values."""
+    __slots__ = ("field", "visible_name", "field_type", "device_clazz", "state_clazz", "unit", "icon", "enabled", "category", "deadband", "max_interval", "trigger")
+
+    def __init__(self, field, visible_name, field_type=FieldType.STR, device_clazz=None, state_clazz=None, unit=None, icon=None, enabled=True, category=None, deadband=None, max_interval=None, trigger=True) -> None:
         self.field = field
-        self.value = value
         self.visible_name = visible_name
         self.field_type = field_type
         self.device_clazz = device_clazz
@@ -77,6 +243,63 @@ class h2m_data():
         self.icon = icon
         self.enabled = enabled
         self.category = category
+        # publish policy, deadband=(absolute, relative) and max_interval in seconds override the helper defaults,
+        # fields with trigger=False never cause a publish on their own
+        self.deadband = deadband
+        self.max_interval = max_interval
+        self.trigger = trigger
+
+class h2m_data():
+    __slots__ = ("meta", "value")
+
+    def __init__(self, field, value, visible_name, field_type=FieldType.STR, device_clazz=None, state_clazz=None, unit=None, icon=None, enabled=True, category=None) -> None:
+        self.meta = h2m_field(field, visible_name, field_type=field_type, device_clazz=device_clazz, state_clazz=state_clazz, unit=unit, icon=icon, enabled=enabled, category=category)
+        self.value = value
+
+    @classmethod
+    def of(cls, meta, value):
+        data = cls.__new__(cls)
+        data.meta = meta
+        data.value = value
+        return data
+
+    def __getattr__(self, name):
+        # field, visible_name, field_type, ... are read from the shared metadata
+        return getattr(self.meta, name)
+
+class h2m_record():
+    """Values of one frame, the metadata tuple is shared with the schema that decoded it."""
+    __slots__ = ("fields", "values")
+
+    def __init__(self, fields, values) -> None:
+        self.fields = fields
+        self.values = values
+
+    @classmethod
+    def of(cls, parsed_values):
+        if isinstance(parsed_values, h2m_record):
+            return parsed_values
+        return cls(tuple(parsed_value.meta for parsed_value in parsed_values), [parsed_value.value for parsed_value in parsed_values])
+
+    def items(self):
+        return zip(self.fields, self.values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        for meta, value in zip(self.fields, self.values):
+            yield h2m_data.of(meta, value)
+
+    def __add__(self, other):
+        other = h2m_record.of(other)
+        return h2m_record(self.fields + other.fields, self.values + other.values)
+
+    def __radd__(self, other):
+        return h2m_record.of(other) + self
+
+# compact encoder of the typed state payloads without orjson, the C encoder is used for the values
+STATE_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=str)
 
 class hargassner():
     def __init__(self, parent_parser, system_id, name) -> None:
@@ -105,6 +328,10 @@ class hargassner():
 
         return current_sensor, False
 
+    def announce(self):
+        for current_sensor in self.sensors.values():
+            current_sensor.announce()
+
 class sensor():
     def __init__(self, parent_system, sensor_id, name) -> None:
         self.sensor_id = sensor_id
@@ -113,30 +340,123 @@ class sensor():
         self.parent_system = parent_system
         self.enabled = False
         self.topic = f"{STATE_PREFIX}/{self.parent_system.system_id}/{self.sensor_id}/data"
+        self.event_topic = f"{STATE_PREFIX}/{self.parent_system.system_id}/{self.sensor_id}/events"
+        # send_events: the next event carries all values
+        self.events_snapshot = True
+        self.events_published = None
+        self.device_topic = f"{HA_PREFIX}/device/{self.parent_system.system_id}_{self.sensor_id}/config"
+        # device discovery: a measurement was added or changed, the device config is sent by announce_new
+        self.device_pending = False
+        self.device_header = None
+        self.device_hash = None
+        # discovery cleanup: the empty device config was sent and accepted by the client
+        self.device_sent = False
+        self.device_cleared = False
+        # field names of the typed state payloads, built once per schema
+        self.state_schema = None
+        self.state_keys = None
         logging.debug(f"Created sensor: sensor_id={self.sensor_id}, name={self.name}, topic={self.topic}")
 
-    def add_measurement(self, parsed_value):
-        measurement_id = self.parent_system.parent_parser.sanitize(parsed_value.field)
-        current_measurement = self.measurements.get(measurement_id)
+    def add_measurement(self, meta, events=False):
+        # field names are usually sanitized already, skip the regex for known measurements
+        current_measurement = self.measurements.get(meta.field)
         if current_measurement is None:
-            current_measurement = measurement(self, parsed_value)
-            self.measurements[measurement_id] = current_measurement
-            return current_measurement, current_measurement.enabled
+            measurement_id = self.parent_system.parent_parser.sanitize(meta.field)
+            current_measurement = self.measurements.get(measurement_id)
+            if current_measurement is None:
+                current_measurement = measurement(self, meta, events)
+                self.measurements[measurement_id] = current_measurement
+                return current_measurement, current_measurement.enabled
 
+        current_measurement.update(meta, events)
         return current_measurement, False
 
     def announce(self):
-        for measurement_name, current_measurement in self.measurements:
-            current_measurement.announce()
+        # home assistant (re)started, the event measurements need all values again
+        self.events_snapshot = True
+        # cleanups not accepted yet are sent again, the broker may not have been connected
+        self.device_sent = self.device_cleared
+        for current_measurement in self.measurements.values():
+            current_measurement.legacy_sent = current_measurement.legacy_cleared
+        if self.parent_system.parent_parser.discovery == "device":
+            self.announce_device(force=True)
+            return
+        for current_measurement in self.measurements.values():
+            current_measurement.announce(force=True)
+
+    def cleanup_done(self):
+        if self.parent_system.parent_parser.discovery == "device":
+            return all(current_measurement.legacy_cleared for current_measurement in self.measurements.values() if current_measurement.enabled)
+        return self.device_cleared
+
+    def device_accepted(self):
+        self.device_cleared = True
+        self.parent_system.parent_parser.cleanup_done()
+
+    def encode_state(self, parsed_values):
+        if self.parent_system.parent_parser.payload == "string":
+            return json.dumps({meta.field: f"{value}" for meta, value in parsed_values.items()})
+
+        # the keys are taken once per schema, the values keep their JSON types in schema order
+        if parsed_values.fields is not self.state_schema:
+            self.state_schema = parsed_values.fields
+            self.state_keys = tuple(meta.field for meta in parsed_values.fields)
+        state = dict(zip(self.state_keys, parsed_values.values))
+        if orjson is not None:
+            return orjson.dumps(state, default=str)
+        return STATE_ENCODER.encode(state)
+
+    def announce_device(self, force=False):
+        """Announce all measurements in one device discovery config, the JSON parts are serialized once and cached."""
+        helper = self.parent_system.parent_parser
+        self.device_pending = False
+        if self.device_header is None:
+            header = json.dumps({
+                "device": self.parent_system.info,
+                "origin": {
+                    "name": "hargassner2mqtt",
+                    "sw": VERSION
+                },
+                "state_topic": self.topic,
+                "qos": 2,
+            })
+            self.device_header = header[:-1] + ', "components": {'
+        components = []
+        for current_measurement in self.measurements.values():
+            if current_measurement.enabled:
+                components.append(current_measurement.get_component_payload())
+                if helper.discovery_cleanup and not current_measurement.legacy_sent:
+                    current_measurement.legacy_sent = True
+                    helper.clear_retained(f"{current_measurement.topic}/config", current_measurement.legacy_accepted)
+        payload = self.device_header + ", ".join(components) + "}}"
+
+        device_hash = hashlib.sha1(payload.encode("utf-8")).digest()
+        if not force and device_hash == self.device_hash:
+            return
+        self.device_hash = device_hash
+        logging.debug(f"Announce device: {self.device_topic} with {len(components)} components")
+        helper.transmit_callback(self.device_topic, payload, retain=True)
 
 class measurement():
-    def __init__(self, parent_sensor, parsed_value) -> None:
+    def __init__(self, parent_sensor, parsed_value, events=False) -> None:
         self.parsed_value = parsed_value
+        # the state is taken from the events topic instead of the state payload
+        self.events = events
         self.component = self.__get_component()
         self.parent_sensor = parent_sensor
         self.topic = f"{HA_PREFIX}/{self.component}/{self.parent_sensor.parent_system.system_id}/{self.parent_sensor.sensor_id}_{self.parsed_value.field}"
         self.uid = f"{STATE_PREFIX}.{self.parent_sensor.parent_system.system_id}_{self.parent_sensor.sensor_id}_{self.parsed_value.field}"
         self.enabled = True
+        self.config_hash = None
+        # cached JSON of the entity config and of the device component
+        self.config_payload = None
+        self.component_payload = None
+        # discovery cleanup: the empty entity config was sent and accepted by the client
+        self.legacy_sent = False
+        self.legacy_cleared = False
+        self.last_value = None
+        self.last_published = None
+        self.__resolve_publish_policy()
         parent_sensor.enabled = True
         parent_sensor.parent_system.enabled = True
         logging.debug(f"Created measurement: measurement_id={self.parsed_value.field}, name={self.parsed_value.visible_name}, topic={self.topic}")
@@ -149,40 +469,111 @@ class measurement():
         else:
             return "sensor"
 
-    def announce(self):
+    def update(self, meta, events=False):
+        # Metadata is shared by reference, announce() still skips unchanged payloads
+        if self.parsed_value is meta and self.events == events:
+            return
+        self.parsed_value = meta
+        self.events = events
+        self.config_payload = None
+        self.component_payload = None
+        self.__resolve_publish_policy()
+        self.announce()
+
+    def __resolve_publish_policy(self):
+        helper = self.parent_sensor.parent_system.parent_parser
+        self.deadband = helper.get_deadband(self.parsed_value)
+        self.max_interval = self.parsed_value.max_interval if self.parsed_value.max_interval is not None else helper.max_interval
+
+    def is_due(self, value, now, max_interval=None):
+        if max_interval is None or self.parsed_value.max_interval is not None:
+            max_interval = self.max_interval
+        if self.last_published is None or now - self.last_published >= max_interval:
+            return True
+        if not self.parsed_value.trigger or value == self.last_value:
+            return False
+        if self.deadband is None or isinstance(value, bool) or not isinstance(value, (int, float)) or not isinstance(self.last_value, (int, float)):
+            return True
+        absolute, relative = self.deadband
+        return abs(value - self.last_value) >= max(absolute, relative * abs(self.last_value))
+
+    def published(self, value, now):
+        self.last_value = value
+        self.last_published = now
+
+    def get_config(self):
+        config_payload = {
+            # "~": self.topic,
+            "name": f"{self.parsed_value.visible_name}",
+            "state_topic": f"{self.parent_sensor.event_topic if self.events else self.parent_sensor.topic}",
+            "device_class": self.parsed_value.device_clazz,
+            "state_class": self.parsed_value.state_clazz,
+            "unit_of_measurement": self.parsed_value.unit,
+            "device": self.parent_sensor.parent_system.info,
+            "origin": {
+                "name": "hargassner2mqtt",
+                "sw": VERSION
+            },
+            "unique_id": self.uid,
+            "default_entity_id": f"{self.component}.{self.uid}",
+            "enabled_by_default": f"{str(self.parsed_value.enabled)}",
+            "platform": self.component,
+            "qos": 2,
+            "value_template": self.get_value_template(),
+        }
+        if (self.parsed_value.icon != None):
+            config_payload["icon"] = self.parsed_value.icon
+        if (self.parsed_value.category != None):
+            config_payload["entity_category"] = self.parsed_value.category
+        if (self.parsed_value.field_type == FieldType.BOOL):
+            config_payload["payload_off"] = str(False)
+            config_payload["payload_on"] = str(True)
+        return config_payload
+
+    def get_component_payload(self):
+        """The entry of this measurement in the components of the device config, without the shared keys."""
+        if self.component_payload is None:
+            # shared keys are in the device config, unset options are left out
+            config_payload = {key: value for key, value in self.get_config().items() if value is not None and key not in ("device", "origin", "qos")}
+            if not self.events:
+                del config_payload["state_topic"]
+            self.component_payload = f"{json.dumps(f'{self.parent_sensor.sensor_id}_{self.parsed_value.field}')}: {json.dumps(config_payload)}"
+        return self.component_payload
+
+    def announce(self, force=False):
         if (self.enabled):
-            config_payload = {
-                # "~": self.topic,
-                "name": f"{self.parsed_value.visible_name}",
-                "state_topic": f"{self.parent_sensor.topic}",
-                "device_class": self.parsed_value.device_clazz,
-                "state_class": self.parsed_value.state_clazz,
-                "unit_of_measurement": self.parsed_value.unit,
-                "device": self.parent_sensor.parent_system.info,
-                "origin": {
-                    "name": "hargassner2mqtt",
-                    "sw": VERSION
-                },
-                "unique_id": self.uid,
-                "default_entity_id": f"{self.component}.{self.uid}",
-                "enabled_by_default": f"{str(self.parsed_value.enabled)}",
-                "platform": self.component,
-                "qos": 2,
-                "value_template": self.get_value_template(),
-            }
-            if (self.parsed_value.icon != None):
-                config_payload["icon"] = self.parsed_value.icon
-            if (self.parsed_value.category != None):
-                config_payload["entity_category"] = self.parsed_value.category
-            if (self.parsed_value.field_type == FieldType.BOOL):
-                config_payload["payload_off"] = str(False)
-                config_payload["payload_on"] = str(True)
-
-            # If it is a new measumente, announce it to hassio
+            helper = self.parent_sensor.parent_system.parent_parser
+            if helper.discovery == "device":
+                self.parent_sensor.device_pending = True
+                return
+
+            if helper.discovery_cleanup and not self.parent_sensor.device_sent:
+                self.parent_sensor.device_sent = True
+                helper.clear_retained(self.parent_sensor.device_topic, self.parent_sensor.device_accepted)
+
+            if self.config_payload is None:
+                self.config_payload = json.dumps(self.get_config())
+            payload = self.config_payload
+            config_hash = hashlib.sha1(payload.encode("utf-8")).digest()
+            if not force and config_hash == self.config_hash:
+                return
+            self.config_hash = config_hash
+
+            # If it is a new or changed measurement, announce it to hassio
             logging.debug(f"Announce measurement: {self.parsed_value.field}, {self.topic}")
-            self.parent_sensor.parent_system.parent_parser.transmit_callback(f"{self.topic}/config", json.dumps(config_payload), retain=True)
+            helper.transmit_callback(f"{self.topic}/config", payload, retain=True)
+
+    def legacy_accepted(self):
+        self.legacy_cleared = True
+        self.parent_sensor.parent_system.parent_parser.cleanup_done()
 
     def get_value_template(self):
+        if self.events:
+            # an event only holds the changed values, the others keep their state
+            return f"{{{{ value_json.{self.parsed_value.field} if '{self.parsed_value.field}' in value_json else '' }}}}"
+        if self.parent_sensor.parent_system.parent_parser.payload == "typed":
+            # numbers and booleans arrive as JSON types, no conversion needed
+            return f"{{{{ value_json.{self.parsed_value.field} }}}}"
         match self.parsed_value.field_type:
             case FieldType.BOOL:
                 return f"{{{{ value_json.{self.parsed_value.field} }}}}"
@@ -0,0 +1,226 @@
+import logging
+import threading
+import time
+
+logging.basicConfig(
+    format='[%(asctime)s] %(levelname)-2s %(message)s',
+    level=logging.INFO,
+    datefmt='%H:%M:%S')
+
+# Upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+class h2m_histogram():
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+class h2m_timer():
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics, name, labels) -> None:
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+class h2m_metrics():
+    """Counters, gauges and latency histograms of the bridge internals.
+
+    Rendered in the Prometheus text format on a small local HTTP endpoint and as JSON
+    snapshot for the MQTT diagnostics topic.
+    """
+    def __init__(self, loglevel=logging.INFO, warn_interval=60.0) -> None:
+        logging.getLogger().setLevel(loglevel)
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.help = {}
+        self.warn_interval = warn_interval
+        self.warnings = {}
+        self.server = None
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = h2m_histogram()
+            histogram.observe(seconds)
+
+    def time(self, name, **labels):
+        return h2m_timer(self, name, labels)
+
+    def gauge(self, name, callback, **labels):
+        """callback() returns the current value, it is called when the metrics are rendered."""
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.gauges.setdefault(name, {})[key] = callback
+
+    def warn(self, key, message, **labels):
+        """Log a warning at most once per warn_interval per key and labels, every call is counted."""
+        self.inc("h2m_warnings_total", key=key, **labels)
+        now = time.monotonic()
+        warning = (key,) + tuple(sorted(labels.items()))
+        with self.lock:
+            last, suppressed = self.warnings.get(warning, (None, 0))
+            if last is not None and now - last < self.warn_interval:
+                self.warnings[warning] = (last, suppressed + 1)
+                return
+            self.warnings[warning] = (now, 0)
+        if suppressed > 0:
+            message = f"{message} ({suppressed} similar warnings suppressed)"
+        logging.warning(message)
+
+    def labeled(self, **labels):
+        """View adding labels to every series, e.g. one per boiler."""
+        return h2m_labeled_metrics(self, labels)
+
+    def __labels(self, key, extra=()):
+        labels = key + extra
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+    def render(self):
+        lines = []
+        with self.lock:
+            counters = {name: dict(series) for name, series in self.counters.items()}
+            histograms = {name: dict(series) for name, series in self.histograms.items()}
+            gauges = {name: dict(series) for name, series in self.gauges.items()}
+
+        for name, series in sorted(counters.items()):
+            if name in self.help:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in series.items():
+                lines.append(f"{name}{self.__labels(key)} {value}")
+        for name, series in sorted(gauges.items()):
+            if name in self.help:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} gauge")
+            for key, callback in series.items():
+                try:
+                    lines.append(f"{name}{self.__labels(key)} {callback()}")
+                except Exception as e:
+                    logging.debug(f"Gauge {name} failed: {e}")
+        for name, series in sorted(histograms.items()):
+            if name in self.help:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{self.__labels(key, (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_bucket{self.__labels(key, (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{name}_sum{self.__labels(key)} {histogram.sum}")
+                lines.append(f"{name}_count{self.__labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """Counters and gauges by name and label string, histograms as count and mean."""
+        snapshot = {}
+        with self.lock:
+            counters = {name: dict(series) for name, series in self.counters.items()}
+            histograms = {name: dict(series) for name, series in self.histograms.items()}
+            gauges = {name: dict(series) for name, series in self.gauges.items()}
+        for name, series in counters.items():
+            for key, value in series.items():
+                snapshot[f"{name}{self.__labels(key)}"] = value
+        for name, series in gauges.items():
+            for key, callback in series.items():
+                try:
+                    snapshot[f"{name}{self.__labels(key)}"] = callback()
+                except Exception as e:
+                    logging.debug(f"Gauge {name} failed: {e}")
+        for name, series in histograms.items():
+            for key, histogram in series.items():
+                snapshot[f"{name}_count{self.__labels(key)}"] = histogram.count
+                snapshot[f"{name}_mean{self.__labels(key)}"] = histogram.sum / histogram.count if histogram.count else 0.0
+        return snapshot
+
+    def serve(self, port, address="127.0.0.1"):
+        # only loaded when the endpoint is enabled
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logging.debug(f"metrics http: {format % args}")
+
+        self.server = ThreadingHTTPServer((address, port), handler)
+        threading.Thread(target=self.server.serve_forever, name="h2m-metrics", daemon=True).start()
+        logging.info(f"Serving metrics on http://{address}:{port}/metrics")
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server = None
+
+class h2m_labeled_metrics():
+    """Same interface as h2m_metrics, every series gets the fixed labels and warnings their values as prefix."""
+    def __init__(self, metrics, labels) -> None:
+        self.metrics = metrics
+        self.labels = labels
+        self.prefix = "[" + ",".join(str(value) for value in labels.values()) + "] "
+
+    def describe(self, name, text):
+        self.metrics.describe(name, text)
+
+    def inc(self, name, value=1, **labels):
+        self.metrics.inc(name, value, **self.labels, **labels)
+
+    def observe(self, name, seconds, **labels):
+        self.metrics.observe(name, seconds, **self.labels, **labels)
+
+    def time(self, name, **labels):
+        return h2m_timer(self.metrics, name, {**self.labels, **labels})
+
+    def gauge(self, name, callback, **labels):
+        self.metrics.gauge(name, callback, **self.labels, **labels)
+
+    def warn(self, key, message, **labels):
+        self.metrics.warn(key, self.prefix + message, **self.labels, **labels)
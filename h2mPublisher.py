@@ -0,0 +1,198 @@
+from collections import deque
+import logging
+import threading
+import time
+
+logging.basicConfig(
+    format='[%(asctime)s] %(levelname)-2s %(message)s',
+    level=logging.INFO,
+    datefmt='%H:%M:%S')
+
+# paho.mqtt.client.MQTT_ERR_SUCCESS, the client is passed in and paho not imported here
+MQTT_ERR_SUCCESS = 0
+
+class h2m_publisher():
+    """Publishes in a background thread so acquisition never waits on the network.
+
+    publish() only queues: retained (discovery) messages go to a bounded high priority
+    queue, state messages are coalesced per topic so only the latest payload is kept.
+    Messages published with coalesce=False (events, where every message counts) and
+    states while offline go to a bounded queue, when it is full the oldest is dropped.
+    QoS 1/2 messages in flight are limited to `window`, the worker waits for the broker
+    acknowledgements before sending more. While the client is disconnected
+    state messages are moved to the optional h2m_store and drained after reconnect,
+    without waiting for the window. first_publish holds the seconds from `started` (monotonic,
+    default the construction) until the client accepted the first state message.
+    """
+    def __init__(self, client, loglevel, store=None, window=20, max_priority=1000, max_messages=1000, metrics=None, started=None) -> None:
+        logging.getLogger().setLevel(loglevel)
+        self.client = client
+        self.store = store
+        self.window = window
+        self.metrics = metrics
+        self.priority = deque(maxlen=max_priority)
+        self.states = {}
+        self.messages = deque(maxlen=max_messages)
+        self.in_flight = []
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.started = started if started is not None else time.monotonic()
+        self.first_publish = None
+
+        # counters
+        self.queued = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.published = 0
+        self.failed = 0
+        self.stored = 0
+        self.window_full = 0
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.__run, name="h2m-publisher", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5.0):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=timeout)
+            self.thread = None
+
+    def publish(self, topic, payload, qos=1, retain=False, coalesce=True, on_sent=None):
+        """transmit_callback of h2m_helper, never blocks on the network.
+
+        on_sent is called from the worker thread once the client accepted the message.
+        """
+        with self.condition:
+            self.queued += 1
+            if retain:
+                if len(self.priority) == self.priority.maxlen:
+                    self.dropped += 1
+                self.priority.append((topic, payload, qos, retain, time.time(), on_sent))
+            elif not coalesce or (self.store is not None and not self.client.is_connected()):
+                # while offline every state goes to the store, nothing is coalesced
+                if len(self.messages) == self.messages.maxlen:
+                    self.dropped += 1
+                self.messages.append((topic, payload, qos, retain, time.time(), on_sent))
+            else:
+                if topic in self.states:
+                    self.coalesced += 1
+                    # keep the position, the newest payload replaces the queued one
+                    del self.states[topic]
+                self.states[topic] = (topic, payload, qos, retain, time.time(), on_sent)
+            self.condition.notify()
+
+    def on_publish(self):
+        """To be called from the client's on_publish callback, wakes up a worker waiting for the window."""
+        with self.condition:
+            self.condition.notify()
+
+    def __window_full(self):
+        if len(self.in_flight) >= self.window:
+            self.in_flight = [info for info in self.in_flight if not info.is_published()]
+        return len(self.in_flight) >= self.window
+
+    def depth(self):
+        return len(self.priority) + len(self.states) + len(self.messages)
+
+    def __next(self):
+        if self.priority:
+            return self.priority.popleft()
+        # the older of the first coalesced state and the first other message
+        state = next(iter(self.states)) if self.states else None
+        if self.messages and (state is None or self.messages[0][4] <= self.states[state][4]):
+            return self.messages.popleft()
+        if state is not None:
+            return self.states.pop(state)
+        return None
+
+    def __blocked(self):
+        # offline with a store the messages go to the store, the window does not apply
+        if self.store is not None and not self.client.is_connected():
+            return False
+        return self.__window_full()
+
+    def __run(self):
+        while True:
+            with self.condition:
+                while self.running and (self.depth() == 0 or self.__blocked()) and not self.__store_pending():
+                    if self.depth() > 0:
+                        self.window_full += 1
+                        self.condition.wait(timeout=0.1)
+                    else:
+                        self.condition.wait(timeout=1.0)
+                if not self.running:
+                    return
+                message = self.__next() if not self.__blocked() else None
+
+            if message is None:
+                self.__drain_store()
+                continue
+            topic, payload, qos, retain, captured, on_sent = message
+            if not retain and self.store is not None and (self.store.depth > 0 or not self.client.is_connected()):
+                # keep the order behind already stored messages
+                self.store.put(topic, payload, qos=qos, retain=retain, captured=captured)
+                self.stored += 1
+            elif not self.__send(topic, payload, qos, retain):
+                if not retain and self.store is not None:
+                    self.store.put(topic, payload, qos=qos, retain=retain, captured=captured)
+                    self.stored += 1
+                else:
+                    # discovery configs are sent again on reconnect
+                    self.dropped += 1
+            elif on_sent is not None:
+                on_sent()
+            self.__drain_store()
+
+    def __store_pending(self):
+        return self.store is not None and self.store.depth > 0 and self.client.is_connected()
+
+    def __drain_store(self):
+        if self.__store_pending():
+            self.store.drain(self.__send)
+            if self.store.depth == 0:
+                logging.info(f"store drained: {self.store.stats()}")
+            else:
+                # leave the cpu to the other threads until the next drain tokens are available
+                time.sleep(0.05)
+        elif self.store is not None and self.store.uncommitted > 0 and time.monotonic() - self.store.last_commit >= self.store.commit_interval:
+            self.store.commit()
+
+    def __send(self, topic, payload, qos=1, retain=False):
+        if not self.client.is_connected():
+            return False
+        start = time.perf_counter()
+        result = self.client.publish(topic, payload=payload, qos=qos, retain=retain)
+        if self.metrics is not None:
+            self.metrics.observe("h2m_stage_seconds", time.perf_counter() - start, stage="publish")
+        if result.rc != MQTT_ERR_SUCCESS:
+            self.failed += 1
+            logging.debug(f"Publish to {topic} failed: {result.rc}")
+            return False
+        self.published += 1
+        if self.first_publish is None and not retain:
+            self.first_publish = time.monotonic() - self.started
+            logging.info(f"First state published {self.first_publish:.2f}s after start")
+        if qos > 0:
+            with self.condition:
+                self.in_flight.append(result)
+        return True
+
+    def stats(self):
+        return {
+            "depth": self.depth(),
+            "in_flight": len(self.in_flight),
+            "queued": self.queued,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "published": self.published,
+            "failed": self.failed,
+            "stored": self.stored,
+            "window_full": self.window_full,
+        }
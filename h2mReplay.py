@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""h2mReplay.py
+Replays recorded Lambdatronic frames and ADC voltages through the bridge, without serial
+port, I2C bus or MQTT broker. Messages go to an in-memory recording sink.
+
+Recording format, one entry per line, empty lines and lines starting with # are skipped:
+    [<seconds><TAB>]pm <40 columns>     a serial frame
+    [<seconds><TAB>]voltage <volts>     an ADC voltage, used for all following frames
+Entries without timestamp are 0.5s apart, the interval the Lambdatronic writes frames in.
+"""
+import argparse
+import logging
+import time
+
+from h2mHelper import h2m_helper
+from h2mBridge import h2m_bridge
+from h2mSerialReader import h2m_frame
+from h2mScheduler import h2m_scheduler
+from h2mEvents import h2m_bit_events
+
+FRAME_INTERVAL = 0.5
+DEFAULT_VOLTAGE = 2.1
+
+class h2m_recording_sink():
+    """Stands in for paho, records every message passed to the transmit callback."""
+    def __init__(self, keep=True) -> None:
+        self.keep = keep
+        self.messages = []
+        self.count = 0
+        self.retained = 0
+        self.bytes = 0
+
+    def __call__(self, topic, payload, qos=1, retain=False, coalesce=True, on_sent=None):
+        self.count += 1
+        self.bytes += len(payload)
+        if retain:
+            self.retained += 1
+        if self.keep:
+            self.messages.append((topic, payload, qos, retain))
+        # a recording accepts every message at once
+        if on_sent is not None:
+            on_sent()
+
+    def stats(self):
+        return {
+            "messages": self.count,
+            "state_messages": self.count - self.retained,
+            "discovery_messages": self.retained,
+            "bytes": self.bytes,
+        }
+
+def read_recording(lines, frame_interval=FRAME_INTERVAL):
+    """Yields (seconds, kind, value) with kind "frame" or "voltage"."""
+    seconds = 0.0
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line.strip() or line.startswith("#"):
+            continue
+        timestamp, separator, entry = line.partition("\t")
+        if separator:
+            seconds = float(timestamp)
+        else:
+            entry = line
+        if entry.startswith("voltage "):
+            yield seconds, "voltage", float(entry[len("voltage "):])
+        else:
+            yield seconds, "frame", entry
+            if not separator:
+                seconds += frame_interval
+
+def replay(lines, transmit_callback, loglevel, speed=0.0, helper_args=None, bridge_args=None, frame_interval=FRAME_INTERVAL):
+    """Runs a recording through h2m_bridge, speed 1 is real time, N is N times faster and 0 unthrottled."""
+    voltage = [DEFAULT_VOLTAGE]
+    helper = h2m_helper(transmit_callback, loglevel, **(helper_args or {}))
+    bridge = h2m_bridge(helper, lambda: voltage[0], loglevel, **(bridge_args or {}))
+
+    wall_start = time.time()
+    start = time.perf_counter()
+    seconds = 0.0
+    frames = 0
+    for seconds, kind, value in read_recording(lines, frame_interval=frame_interval):
+        if speed > 0:
+            delay = start + seconds / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        if kind == "voltage":
+            voltage[0] = value
+            continue
+        bridge.process((h2m_frame(seconds, wall_start + seconds, value.encode(encoding="ascii", errors="ignore")),))
+        frames += 1
+    elapsed = time.perf_counter() - start
+
+    stats = bridge.stats()
+    stats["frames"] = frames
+    stats["recorded_seconds"] = round(seconds, 3)
+    stats["elapsed_seconds"] = round(elapsed, 3)
+    stats["frames_per_second"] = round(frames / elapsed, 1) if elapsed > 0 else 0.0
+    stats["publishes_per_second"] = round(stats["publishes"] / elapsed, 1) if elapsed > 0 else 0.0
+    return stats
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("recording", help="file with recorded frames and voltages")
+    arg_parser.add_argument("--speed", type=float, default=0.0, help="playback speed, 1 = real time, 0 = unthrottled (default)")
+    arg_parser.add_argument("--window", type=int, default=20, help="aggregation window in frames")
+    arg_parser.add_argument("--schedule", action="store_true", help="switch the publish mode by boiler status")
+    arg_parser.add_argument("--events", action="store_true", help="publish the register bits as events instead of in the state")
+    arg_parser.add_argument("--print", action="store_true", help="print every published message")
+    arg_parser.add_argument("--debug", action="store_true", help="debug logging")
+    args = arg_parser.parse_args()
+
+    loglevel = logging.DEBUG if args.debug else logging.WARNING
+    logging.basicConfig(
+        format='[%(asctime)s] %(levelname)-2s %(message)s',
+        level=loglevel,
+        datefmt='%H:%M:%S')
+
+    sink = h2m_recording_sink(keep=args.print)
+    bridge_args = {"aggregation_window": args.window}
+    if args.schedule:
+        bridge_args["scheduler"] = h2m_scheduler(loglevel)
+    if args.events:
+        bridge_args["events"] = h2m_bit_events(loglevel)
+    with open(args.recording, encoding="ascii", errors="ignore") as recording:
+        stats = replay(recording, sink, loglevel, speed=args.speed, bridge_args=bridge_args)
+    if args.schedule:
+        stats.update(bridge_args["scheduler"].stats())
+    if args.events:
+        stats.update({f"events_{key}": value for key, value in bridge_args["events"].stats().items()})
+
+    if args.print:
+        for topic, payload, qos, retain in sink.messages:
+            print(f"{topic} (qos={qos}, retain={retain}): {payload}")
+    stats.update(sink.stats())
+    for key, value in stats.items():
+        print(f"{key}: {value}")
@@ -0,0 +1,105 @@
+import logging
+
+logging.basicConfig(
+    format='[%(asctime)s] %(levelname)-2s %(message)s',
+    level=logging.INFO,
+    datefmt='%H:%M:%S')
+
+class h2m_mode():
+    """Publish cadence: frames aggregated per publish and heartbeat in seconds."""
+    __slots__ = ("name", "window", "max_interval")
+
+    def __init__(self, name, window, max_interval) -> None:
+        self.name = name
+        self.window = window
+        self.max_interval = max_interval
+
+DEFAULT_MODES = (
+    h2m_mode("fast", window=1, max_interval=60),
+    h2m_mode("normal", window=20, max_interval=300),
+    h2m_mode("idle", window=120, max_interval=900),
+)
+
+# mode per boiler status, see STATUS_TEXT in h2mSerialParser
+DEFAULT_STATUS_MODES = {
+    0: "idle",
+    6: "fast",
+    7: "fast",
+    9: "fast",
+    10: "fast",
+    14: "normal",
+    15: "normal",
+    17: "normal",
+    18: "fast",
+}
+
+class h2m_scheduler():
+    """Selects the publish mode from the boiler status of every frame.
+
+    status_modes maps the status to a mode name, field_modes maps binary fields to the mode
+    used while they are on. Of all matching modes the one with the smallest window wins.
+    The time spent in every mode is accumulated from the frame timestamps.
+    """
+    def __init__(self, loglevel, modes=DEFAULT_MODES, status_modes=DEFAULT_STATUS_MODES, field_modes=None, default_mode="normal", status_field="status", max_gap=5.0) -> None:
+        logging.getLogger().setLevel(loglevel)
+        self.modes = {mode.name: mode for mode in modes}
+        for name in list(status_modes.values()) + list((field_modes or {}).values()) + [default_mode]:
+            if name not in self.modes:
+                raise ValueError(f"unknown publish mode: {name}")
+        self.status_modes = {status: self.modes[name] for status, name in status_modes.items()}
+        self.field_modes = {field: self.modes[name] for field, name in (field_modes or {}).items()}
+        self.default_mode = self.modes[default_mode]
+        self.status_field = status_field
+        self.max_gap = max_gap
+        self.mode = self.default_mode
+        self.schema = None
+        self.status_index = None
+        self.field_indexes = ()
+        self.previous_time = None
+
+        # counters
+        self.transitions = 0
+        self.residency = {name: 0.0 for name in self.modes}
+
+    def __setup(self, fields):
+        names = {meta.field: i for i, meta in enumerate(fields)}
+        self.schema = fields
+        self.status_index = names.get(self.status_field)
+        if self.status_index is None:
+            logging.warning(f"Scheduler: unknown status field {self.status_field}")
+        self.field_indexes = tuple((names[field], mode) for field, mode in self.field_modes.items() if field in names)
+
+    def select(self, record):
+        if record.fields is not self.schema:
+            self.__setup(record.fields)
+        values = record.values
+        mode = self.default_mode
+        if self.status_index is not None:
+            mode = self.status_modes.get(values[self.status_index], self.default_mode)
+        for index, field_mode in self.field_indexes:
+            if values[index] and field_mode.window < mode.window:
+                mode = field_mode
+        return mode
+
+    def update(self, record, now):
+        """Account the frame captured at monotonic time now, returns the previous mode on a transition, else None."""
+        if self.previous_time is not None:
+            elapsed = now - self.previous_time
+            if 0 <= elapsed <= self.max_gap:
+                self.residency[self.mode.name] += elapsed
+        self.previous_time = now
+
+        mode = self.select(record)
+        if mode is self.mode:
+            return None
+        previous, self.mode = self.mode, mode
+        self.transitions += 1
+        logging.info(f"Publish mode {previous.name} -> {mode.name}")
+        return previous
+
+    def stats(self):
+        return {
+            "mode": self.mode.name,
+            "transitions": self.transitions,
+            "residency": {name: round(seconds, 1) for name, seconds in self.residency.items()},
+        }
@@ -1,4 +1,4 @@
-from h2mHelper import h2m_data, FieldType
+from h2mHelper import h2m_field, h2m_record, FieldType
 import logging
 
 logging.basicConfig(
@@ -6,96 +6,188 @@ logging.basicConfig(
     level=logging.INFO,
     datefmt='%H:%M:%S')
 
+STATUS_TEXT = {
+    0: "Aus",
+    6: "BSK öffnet",
+    7: "Zündung",
+    9: "Zündung",
+    10: "Zündung",
+    14: "Leistungsbrand",
+    15: "Gluterhaltung",
+    17: "Entaschung in 10 min",
+    18: "Entaschen",
+}
+
+def get_status_as_text(status):
+    return STATUS_TEXT.get(status, str(status))
+
+class h2m_column():
+    """Where a field is found in a frame: a column, or a bit of a hex register column."""
+    __slots__ = ("meta", "column", "mask", "invert", "convert")
+
+    def __init__(self, meta, column, mask=None, invert=False, convert=None) -> None:
+        self.meta = meta
+        self.column = column
+        self.mask = mask
+        self.invert = invert
+        self.convert = convert
+
+class h2m_register():
+    """The bit fields of one hex register column.
+
+    mask covers all bits used by the fields, decode() looks the tuple of field values of a
+    masked word up in a table filled with every word seen, the words rarely change.
+    """
+    __slots__ = ("column", "mask", "bits", "fields", "table")
+
+    def __init__(self, column, columns) -> None:
+        self.column = column
+        self.bits = tuple((column.mask, column.invert) for column in columns)
+        self.fields = tuple(column.meta for column in columns)
+        self.mask = 0
+        for mask, _ in self.bits:
+            self.mask |= mask
+        self.table = {}
+
+    def decode(self, word):
+        values = self.table.get(word)
+        if values is None:
+            values = tuple((word & mask != 0) != invert for mask, invert in self.bits)
+            self.table[word] = values
+        return values
+
+def registers_of(schema):
+    """The h2m_register of every hex register column of schema, fields in schema order."""
+    registers = {}
+    for column in schema:
+        if column.mask is not None:
+            registers.setdefault(column.column, []).append(column)
+    return tuple(h2m_register(column, columns) for column, columns in sorted(registers.items()))
+
+FRAME_PREFIX = b"pm"
+FRAME_COLUMNS = 41
+
+SCHEMA = (
+    h2m_column(h2m_field("primaerluftgeblaese", "Primärluftgebläse", field_type=FieldType.FLOAT, unit="%", icon="mdi:fan-speed-1", state_clazz="measurement"), 1),
+    h2m_column(h2m_field("saugzuggeblaese", "Saugzuggebläse", field_type=FieldType.FLOAT, unit="%", icon="mdi:fan", state_clazz="measurement"), 2),
+    h2m_column(h2m_field("o2_im_rauchgas", "O2 im Rauchgas", field_type=FieldType.FLOAT, unit="%", icon="mdi:smoke", state_clazz="measurement"), 3),
+    h2m_column(h2m_field("temperatur_kessel", "Temperatur Kessel", field_type=FieldType.FLOAT, unit="°C", device_clazz="temperature", state_clazz="measurement"), 4),
+    h2m_column(h2m_field("temperatur_rauchgas", "Temperatur Rauchgas", field_type=FieldType.FLOAT, unit="°C", device_clazz="temperature", state_clazz="measurement"), 5),
+    h2m_column(h2m_field("temperatur_aussen", "Temperatur Aussen", field_type=FieldType.FLOAT, unit="°C", device_clazz="temperature", state_clazz="measurement"), 6),
+    h2m_column(h2m_field("temperatur_aussen_mittel", "Temperatur Aussen Mittel", field_type=FieldType.FLOAT, unit="°C", device_clazz="temperature", state_clazz="measurement"), 7),
+    h2m_column(h2m_field("temperatur_heizkreis_1", "Temperatur Heizkreis 1", field_type=FieldType.FLOAT, unit="°C", device_clazz="temperature", state_clazz="measurement"), 8),
+    h2m_column(h2m_field("temperatur_heizkreis_2", "Temperatur Heizkreis 2", field_type=FieldType.FLOAT, unit="°C", device_clazz="temperature", state_clazz="measurement"), 9),
+    h2m_column(h2m_field("temperatur_heizkreis_1_soll", "Temperatur Heizkreis 1 Soll", field_type=FieldType.FLOAT, unit="°C", device_clazz="temperature", state_clazz="measurement"), 10),
+    h2m_column(h2m_field("temperatur_heizkreis_2_soll", "Temperatur Heizkreis 2 Soll", field_type=FieldType.FLOAT, unit="°C", device_clazz="temperature", state_clazz="measurement"), 11),
+    h2m_column(h2m_field("temperatur_ruecklauf", "Temperatur Rücklauf", field_type=FieldType.FLOAT, unit="°C", device_clazz="temperature", state_clazz="measurement"), 12),
+    h2m_column(h2m_field("temperatur_boiler", "Temperatur Boiler", field_type=FieldType.FLOAT, unit="°C", device_clazz="temperature", state_clazz="measurement"), 13),
+    h2m_column(h2m_field("foerdermenge", "Fördermenge", field_type=FieldType.FLOAT, unit="%", icon="mdi:pine-tree-fire", state_clazz="measurement"), 14),
+    h2m_column(h2m_field("temperatur_kessel_soll", "Temperatur Kessel Soll", field_type=FieldType.FLOAT, unit="°C", device_clazz="temperature", state_clazz="measurement"), 15),
+    h2m_column(h2m_field("status", "Status", field_type=FieldType.INT, category="diagnostic"), 29),
+    h2m_column(h2m_field("statusnachricht", "Statusnachricht"), 29, convert=lambda value: get_status_as_text(int(value))),
+    h2m_column(h2m_field("einschubschnecke_strom", "Einschubschnecke Strom", field_type=FieldType.FLOAT, unit="A", device_clazz="current", state_clazz="measurement", enabled=False), 30),
+    h2m_column(h2m_field("raumaustragung_strom", "Raumaustragung Strom", field_type=FieldType.FLOAT, unit="A", device_clazz="current", state_clazz="measurement", enabled=False), 31),
+    h2m_column(h2m_field("ascheaustragung_strom", "Ascheaustragung Strom", field_type=FieldType.FLOAT, unit="A", device_clazz="current", state_clazz="measurement", enabled=False), 32),
+    h2m_column(h2m_field("einschubschnecke_vorwaerts", "Einschubschnecke Vorwärts", field_type=FieldType.BOOL, device_clazz="running", enabled=False), 33, mask=1),
+    h2m_column(h2m_field("einschubschnecke_rueckwaerts", "Einschubschnecke Rückwärts", field_type=FieldType.BOOL, device_clazz="running", enabled=False), 33, mask=2),
+    h2m_column(h2m_field("raumaustragung_vorwaerts", "Raumaustragung Vorwärts", field_type=FieldType.BOOL, device_clazz="running", enabled=False), 33, mask=4),
+    h2m_column(h2m_field("raumaustragung_rueckwaerts", "Raumaustragung Rückwärts", field_type=FieldType.BOOL, device_clazz="running", enabled=False), 33, mask=8),
+    h2m_column(h2m_field("ascheaustragung_vorwaerts", "Ascheaustragung Vorwärts", field_type=FieldType.BOOL, device_clazz="running", enabled=False), 33, mask=16),
+    h2m_column(h2m_field("ascheaustragung_rueckwaerts", "Ascheaustragung Rückwärts", field_type=FieldType.BOOL, device_clazz="running", enabled=False), 33, mask=32),
+    h2m_column(h2m_field("branschutzklappe_motor", "Brandschutzklappe Motor", field_type=FieldType.BOOL, device_clazz="running", enabled=False), 34, mask=1),
+    h2m_column(h2m_field("zuendung_geblaese", "Zündung Gebläse", field_type=FieldType.BOOL, device_clazz="running"), 34, mask=2),
+    h2m_column(h2m_field("zuendung_heizung", "Zündung Heizung", field_type=FieldType.BOOL, device_clazz="running"), 34, mask=4),
+    h2m_column(h2m_field("pumpe_fernleitung", "Pumpe Fernleitung", field_type=FieldType.BOOL, device_clazz="running"), 34, mask=8),
+    h2m_column(h2m_field("pumpe_boiler", "Pumpe Boiler", field_type=FieldType.BOOL, device_clazz="running"), 34, mask=16),
+    h2m_column(h2m_field("pumpe_heizkreis_1", "Pumpe Heizkreis 1", field_type=FieldType.BOOL, device_clazz="running"), 34, mask=32),
+    h2m_column(h2m_field("mischer_heizkreis_1_auf", "Mischer Heizkreis 1 Auf", field_type=FieldType.BOOL, device_clazz="running", enabled=False), 34, mask=64),
+    h2m_column(h2m_field("mischer_heizkreis_1_zu", "Mischer Heizkreis 1 Zu", field_type=FieldType.BOOL, device_clazz="running", enabled=False), 34, mask=128),
+    h2m_column(h2m_field("pumpe_heizkreis_2", "Pumpe Heizkreis 2", field_type=FieldType.BOOL, device_clazz="running"), 34, mask=256),
+    h2m_column(h2m_field("mischer_heizkreis_2_auf", "Mischer Heizkreis 2 Auf", field_type=FieldType.BOOL, device_clazz="running", enabled=False), 34, mask=512),
+    h2m_column(h2m_field("mischer_heizkreis_2_zu", "Mischer Heizkreis 2 Zu", field_type=FieldType.BOOL, device_clazz="running", enabled=False), 34, mask=1024),
+    h2m_column(h2m_field("stoerung", "Störung", field_type=FieldType.BOOL, device_clazz="problem"), 34, mask=2048),
+    h2m_column(h2m_field("pumpe_ruecklauf", "Pumpe Rücklauf", field_type=FieldType.BOOL, device_clazz="running"), 35, mask=8),
+    h2m_column(h2m_field("rost", "Rost", field_type=FieldType.BOOL, device_clazz="opening", enabled=False), 36, mask=128, invert=True),
+    h2m_column(h2m_field("brandschutzklappe", "Brandschutzklappe", field_type=FieldType.BOOL, device_clazz="opening"), 36, mask=256),
+    h2m_column(h2m_field("anforderung_externer_heizkreis", "Anforderung Ext. HK", field_type=FieldType.BOOL, device_clazz="running"), 36, mask=512),
+)
+
+def decode_ascii(value):
+    return value.decode('ascii')
+
+class h2m_decoder():
+    """Decodes the split columns of a frame with a schema of h2m_column.
+
+    The converter of every plain column and the h2m_register of every hex register are
+    resolved once. Per frame each register is converted once and its bit fields are taken
+    from the table of the register. decode() returns the plain values in schema order,
+    the metadata is shared through self.fields. Columns are bytes, int() and float()
+    convert them without decoding the frame to str first.
+    """
+    def __init__(self, schema) -> None:
+        self.fields = tuple(column.meta for column in schema)
+        self.registers = registers_of(schema)
+        # (column, converter) of the plain columns in schema order
+        self.converters = tuple((column.column, self.__converter(column)) for column in schema if column.mask is None)
+
+        # the plain values are decoded first and the bits of the registers appended,
+        # order maps them back to schema order unless the schema already is in that order
+        decoded = [i for i, column in enumerate(schema) if column.mask is None]
+        for register in self.registers:
+            decoded.extend(i for i, column in enumerate(schema) if column.mask is not None and column.column == register.column)
+        self.order = None
+        if decoded != list(range(len(schema))):
+            self.order = tuple(decoded.index(i) for i in range(len(schema)))
+
+    def __converter(self, column):
+        if column.convert is not None:
+            return column.convert
+        if column.meta.field_type == FieldType.FLOAT:
+            return float
+        if column.meta.field_type == FieldType.INT:
+            return int
+        return decode_ascii
+
+    def decode(self, columns):
+        values = [convert(columns[column]) for column, convert in self.converters]
+        for register in self.registers:
+            word = int(columns[register.column], 16) & register.mask
+            values.extend(register.table.get(word) or register.decode(word))
+        if self.order is not None:
+            values = [values[i] for i in self.order]
+        return values
+
 class h2m_serial_parser():
-    def __init__(self, loglevel) -> None:
+    def __init__(self, loglevel, schema=SCHEMA) -> None:
         logging.getLogger().setLevel(loglevel)
+        self.decoder = h2m_decoder(schema)
+        # reason of the last invalid frame: "prefix", "length" or "exception"
+        self.last_error = None
+        # split columns of the last valid frame, e.g. for h2m_bit_events
+        self.columns = None
         return
 
-    def __get_status_as_text(self, status):
-        match status:
-            case 0:
-                return "Aus"
-            case 6:
-                return "BSK öffnet"
-            case 7:
-                return "Zündung"
-            case 9:
-                return "Zündung"
-            case 10:
-                return "Zündung"
-            case 14:
-                return "Leistungsbrand"
-            case 15:
-                return "Gluterhaltung"
-            case 17:
-                return "Entaschung in 10 min"
-            case 18:
-                return "Entaschen"
-            case _:
-                return str(status)
-
     def parse(self, value):
         logging.debug(f"Parsing: {value}")
-        parsed_values = []
         try:
+            if isinstance(value, str):
+                value = value.encode(encoding='ascii', errors='ignore')
             value = value.strip()
-            if not value.startswith("pm"):
+            if not value.startswith(FRAME_PREFIX):
                 logging.debug(f"not starting with pm")
-                return parsed_values, False
+                self.last_error = "prefix"
+                return [], False
 
-            values = value.split(" ")
-            if len(values) != 41:
+            values = value.split(b" ")
+            if len(values) != FRAME_COLUMNS:
                 logging.debug(f"data has wrong length: {len(values)}")
-                return parsed_values, False
-
-            parsed_values.append(h2m_data("primaerluftgeblaese", values[1], "Primärluftgebläse", field_type=FieldType.FLOAT, unit="%", icon="mdi:fan-speed-1", state_clazz="measurement"))
-            parsed_values.append(h2m_data("saugzuggeblaese", values[2], "Saugzuggebläse", field_type=FieldType.FLOAT, unit="%", icon="mdi:fan", state_clazz="measurement"))
-            parsed_values.append(h2m_data("o2_im_rauchgas", values[3], "O2 im Rauchgas", field_type=FieldType.FLOAT, unit="%", icon="mdi:smoke", state_clazz="measurement"))
-            parsed_values.append(h2m_data("temperatur_kessel", values[4], "Temperatur Kessel", field_type=FieldType.FLOAT, unit="°C", device_clazz="temperature", state_clazz="measurement"))
-            parsed_values.append(h2m_data("temperatur_rauchgas", values[5], "Temperatur Rauchgas", field_type=FieldType.FLOAT, unit="°C", device_clazz="temperature", state_clazz="measurement"))
-            parsed_values.append(h2m_data("temperatur_aussen", values[6], "Temperatur Aussen", field_type=FieldType.FLOAT, unit="°C", device_clazz="temperature", state_clazz="measurement"))
-            parsed_values.append(h2m_data("temperatur_aussen_mittel", values[7], "Temperatur Aussen Mittel", field_type=FieldType.FLOAT, unit="°C", device_clazz="temperature", state_clazz="measurement"))
-            parsed_values.append(h2m_data("temperatur_heizkreis_1", values[8], "Temperatur Heizkreis 1", field_type=FieldType.FLOAT, unit="°C", device_clazz="temperature", state_clazz="measurement"))
-            parsed_values.append(h2m_data("temperatur_heizkreis_2", values[9], "Temperatur Heizkreis 2", field_type=FieldType.FLOAT, unit="°C", device_clazz="temperature", state_clazz="measurement"))
-            parsed_values.append(h2m_data("temperatur_heizkreis_1_soll", values[10], "Temperatur Heizkreis 1 Soll", field_type=FieldType.FLOAT, unit="°C", device_clazz="temperature", state_clazz="measurement"))
-            parsed_values.append(h2m_data("temperatur_heizkreis_2_soll", values[11], "Temperatur Heizkreis 2 Soll", field_type=FieldType.FLOAT, unit="°C", device_clazz="temperature", state_clazz="measurement"))
-            parsed_values.append(h2m_data("temperatur_ruecklauf", values[12], "Temperatur Rücklauf", field_type=FieldType.FLOAT, unit="°C", device_clazz="temperature", state_clazz="measurement"))
-            parsed_values.append(h2m_data("temperatur_boiler", values[13], "Temperatur Boiler", field_type=FieldType.FLOAT, unit="°C", device_clazz="temperature", state_clazz="measurement"))
-            parsed_values.append(h2m_data("foerdermenge", values[14], "Fördermenge", field_type=FieldType.FLOAT, unit="%", icon="mdi:pine-tree-fire", state_clazz="measurement"))
-            parsed_values.append(h2m_data("temperatur_kessel_soll", values[15], "Temperatur Kessel Soll", field_type=FieldType.FLOAT, unit="°C", device_clazz="temperature", state_clazz="measurement"))
-            parsed_values.append(h2m_data("status", values[29], "Status", field_type=FieldType.INT, category="diagnostic"))
-            parsed_values.append(h2m_data("statusnachricht", self.__get_status_as_text(int(values[29])), "Statusnachricht"))
-            parsed_values.append(h2m_data("einschubschnecke_strom", values[30], "Einschubschnecke Strom", field_type=FieldType.FLOAT, unit="A", device_clazz="current", state_clazz="measurement", enabled=False))
-            parsed_values.append(h2m_data("raumaustragung_strom", values[31], "Raumaustragung Strom", field_type=FieldType.FLOAT, unit="A", device_clazz="current", state_clazz="measurement", enabled=False))
-            parsed_values.append(h2m_data("ascheaustragung_strom", values[32], "Ascheaustragung Strom", field_type=FieldType.FLOAT, unit="A", device_clazz="current", state_clazz="measurement", enabled=False))
-            register1 = int(values[33], 16)
-            parsed_values.append(h2m_data("einschubschnecke_vorwaerts", str(register1 & 1 != 0), "Einschubschnecke Vorwärts", field_type=FieldType.BOOL, device_clazz="running", enabled=False))
-            parsed_values.append(h2m_data("einschubschnecke_rueckwaerts", str(register1 & 2 != 0), "Einschubschnecke Rückwärts", field_type=FieldType.BOOL, device_clazz="running", enabled=False))
-            parsed_values.append(h2m_data("raumaustragung_vorwaerts", str(register1 & 4 != 0), "Raumaustragung Vorwärts", field_type=FieldType.BOOL, device_clazz="running", enabled=False))
-            parsed_values.append(h2m_data("raumaustragung_rueckwaerts", str(register1 & 8 != 0), "Raumaustragung Rückwärts", field_type=FieldType.BOOL, device_clazz="running", enabled=False))
-            parsed_values.append(h2m_data("ascheaustragung_vorwaerts", str(register1 & 16 != 0), "Ascheaustragung Vorwärts", field_type=FieldType.BOOL, device_clazz="running", enabled=False))
-            parsed_values.append(h2m_data("ascheaustragung_rueckwaerts", str(register1 & 32 != 0), "Ascheaustragung Rückwärts", field_type=FieldType.BOOL, device_clazz="running", enabled=False))
-            register2 = int(values[34], 16)
-            parsed_values.append(h2m_data("branschutzklappe_motor", str(register2 & 1 != 0), "Brandschutzklappe Motor", field_type=FieldType.BOOL, device_clazz="running", enabled=False))
-            parsed_values.append(h2m_data("zuendung_geblaese", str(register2 & 2 != 0), "Zündung Gebläse", field_type=FieldType.BOOL, device_clazz="running"))
-            parsed_values.append(h2m_data("zuendung_heizung", str(register2 & 4 != 0), "Zündung Heizung", field_type=FieldType.BOOL, device_clazz="running"))
-            parsed_values.append(h2m_data("pumpe_fernleitung", str(register2 & 8 != 0), "Pumpe Fernleitung", field_type=FieldType.BOOL, device_clazz="running"))
-            parsed_values.append(h2m_data("pumpe_boiler", str(register2 & 16 != 0), "Pumpe Boiler", field_type=FieldType.BOOL, device_clazz="running"))
-            parsed_values.append(h2m_data("pumpe_heizkreis_1", str(register2 & 32 != 0), "Pumpe Heizkreis 1", field_type=FieldType.BOOL, device_clazz="running"))
-            parsed_values.append(h2m_data("mischer_heizkreis_1_auf", str(register2 & 64 != 0), "Mischer Heizkreis 1 Auf", field_type=FieldType.BOOL, device_clazz="running", enabled=False))
-            parsed_values.append(h2m_data("mischer_heizkreis_1_zu", str(register2 & 128 != 0), "Mischer Heizkreis 1 Zu", field_type=FieldType.BOOL, device_clazz="running", enabled=False))
-            parsed_values.append(h2m_data("pumpe_heizkreis_2", str(register2 & 256 != 0), "Pumpe Heizkreis 2", field_type=FieldType.BOOL, device_clazz="running"))
-            parsed_values.append(h2m_data("mischer_heizkreis_2_auf", str(register2 & 512 != 0), "Mischer Heizkreis 2 Auf", field_type=FieldType.BOOL, device_clazz="running", enabled=False))
-            parsed_values.append(h2m_data("mischer_heizkreis_2_zu", str(register2 & 1024 != 0), "Mischer Heizkreis 2 Zu", field_type=FieldType.BOOL, device_clazz="running", enabled=False))
-            parsed_values.append(h2m_data("stoerung", str(register2 & 2048 != 0), "Störung", field_type=FieldType.BOOL, device_clazz="problem"))
-            register3 = int(values[35], 16)
-            parsed_values.append(h2m_data("pumpe_ruecklauf", str(register3 & 8 != 0), "Pumpe Rücklauf", field_type=FieldType.BOOL, device_clazz="running"))
-            register4 = int(values[36], 16)
-            parsed_values.append(h2m_data("rost", str(register4 & 128 == 0), "Rost", field_type=FieldType.BOOL, device_clazz="opening", enabled=False))
-            parsed_values.append(h2m_data("brandschutzklappe", str(register4 & 256 != 0), "Brandschutzklappe", field_type=FieldType.BOOL, device_clazz="opening"))
-            parsed_values.append(h2m_data("anforderung_externer_heizkreis", str(register4 & 512 != 0), "Anforderung Ext. HK", field_type=FieldType.BOOL, device_clazz="running"))
-
-            return parsed_values, True
+                self.last_error = "length"
+                return [], False
+
+            record = h2m_record(self.decoder.fields, self.decoder.decode(values))
+            self.columns = values
+            return record, True
         except Exception as e:
             logging.debug(f"Parse failed: {e}")
-            return parsed_values, False
+            self.last_error = "exception"
+            return [], False
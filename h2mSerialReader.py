@@ -0,0 +1,171 @@
+from collections import deque
+import logging
+import threading
+import time
+
+logging.basicConfig(
+    format='[%(asctime)s] %(levelname)-2s %(message)s',
+    level=logging.INFO,
+    datefmt='%H:%M:%S')
+
+# Every frame of the Lambdatronic starts with "pm" and ends with a line break
+FRAME_START = b"pm"
+FRAME_END = b"\n"
+
+class h2m_frame():
+    __slots__ = ("monotonic", "wall", "line")
+
+    def __init__(self, monotonic, wall, line) -> None:
+        self.monotonic = monotonic
+        self.wall = wall
+        # the raw bytes as received, str for frames from other sources
+        self.line = line
+
+    def text(self):
+        if isinstance(self.line, str):
+            return self.line
+        return self.line.decode(encoding='ascii', errors='ignore')
+
+class h2m_frame_tokenizer():
+    """Splits the received bytes into frames, a partial frame is kept until the next read.
+
+    Bytes in front of a frame start are skipped. A frame start inside an unterminated frame
+    drops the truncated frame and resynchronises on the new one, so line noise costs at most
+    the frame it hit. Frames longer than max_frame without line break are dropped as well.
+    """
+    def __init__(self, max_frame=1024) -> None:
+        self.buffer = bytearray()
+        self.max_frame = max_frame
+
+        # counters
+        self.frames = 0
+        self.truncated = 0
+        self.bytes_skipped = 0
+
+    def feed(self, data):
+        """Append received bytes, returns the complete frames found as bytes without line break."""
+        buffer = self.buffer
+        buffer += data
+        frames = []
+        position = 0
+        with memoryview(buffer) as view:
+            while True:
+                start = buffer.find(FRAME_START, position)
+                if start < 0:
+                    # a trailing "p" may be the first half of the next frame start
+                    keep = len(buffer) - 1 if buffer.endswith(FRAME_START[:1]) else len(buffer)
+                    self.bytes_skipped += max(keep - position, 0)
+                    position = max(keep, position)
+                    break
+                self.bytes_skipped += start - position
+                end = buffer.find(FRAME_END, start)
+                resync = buffer.find(FRAME_START, start + 2, end if end >= 0 else len(buffer))
+                if resync >= 0:
+                    self.truncated += 1
+                    self.bytes_skipped += resync - start
+                    position = resync
+                    continue
+                if end < 0:
+                    if len(buffer) - start > self.max_frame:
+                        self.truncated += 1
+                        self.bytes_skipped += len(buffer) - start
+                        position = len(buffer)
+                    else:
+                        position = start
+                    break
+                # strip a trailing carriage return and blanks
+                stop = end
+                while stop > start and buffer[stop - 1] in b" \r\t":
+                    stop -= 1
+                frames.append(view[start:stop].tobytes())
+                self.frames += 1
+                position = end + 1
+        del buffer[:position]
+        return frames
+
+class h2m_serial_reader():
+    """Drains the serial port in a background thread into a bounded ring buffer.
+
+    The Lambdatronic writes a frame every 0.5s, the reader keeps the newest
+    `capacity` frames and the consumer takes them out on its own schedule.
+    Whatever is waiting on the port is read at once and split by h2m_frame_tokenizer,
+    frames stay bytes until the parser splits them.
+    """
+    def __init__(self, serial_port, loglevel, capacity=120, metrics=None) -> None:
+        logging.getLogger().setLevel(loglevel)
+        self.serial_port = serial_port
+        self.metrics = metrics
+        self.frames = deque(maxlen=capacity)
+        self.tokenizer = h2m_frame_tokenizer()
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+        # counters
+        self.bytes_read = 0
+        self.frames_received = 0
+        self.frames_overwritten = 0
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.__run, name="h2m-serial-reader", daemon=True)
+        self.thread.start()
+        logging.debug(f"Started serial reader for {self.serial_port.name}")
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+            self.thread = None
+
+    def __run(self):
+        while self.running:
+            start = time.perf_counter()
+            try:
+                # blocks for the first byte up to the port timeout, then takes everything waiting
+                raw = self.serial_port.read(self.serial_port.in_waiting or 1)
+            except Exception as e:
+                if self.metrics is not None:
+                    self.metrics.warn("serial_read", f"Serial read failed: {e}")
+                else:
+                    logging.error(f"Serial read failed: {e}")
+                time.sleep(1)
+                continue
+            if not raw:
+                continue
+            if self.metrics is not None:
+                self.metrics.observe("h2m_stage_seconds", time.perf_counter() - start, stage="read")
+            self.bytes_read += len(raw)
+            lines = self.tokenizer.feed(raw)
+            if not lines:
+                continue
+            monotonic = time.monotonic()
+            wall = time.time()
+            for line in lines:
+                self.push(h2m_frame(monotonic, wall, line))
+
+    def push(self, frame):
+        with self.lock:
+            if len(self.frames) == self.frames.maxlen:
+                self.frames_overwritten += 1
+            self.frames.append(frame)
+            self.frames_received += 1
+
+    def take(self):
+        """Return all buffered frames, oldest first, and empty the buffer."""
+        with self.lock:
+            frames = list(self.frames)
+            self.frames.clear()
+        return frames
+
+    def stats(self):
+        return {
+            "bytes_read": self.bytes_read,
+            "bytes_skipped": self.tokenizer.bytes_skipped,
+            "frames_received": self.frames_received,
+            "frames_dropped": self.tokenizer.truncated,
+            "frames_overwritten": self.frames_overwritten,
+            "frames_buffered": len(self.frames),
+        }
@@ -0,0 +1,268 @@
+from collections import deque
+from h2mHelper import FieldType
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+
+logging.basicConfig(
+    format='[%(asctime)s] %(levelname)-2s %(message)s',
+    level=logging.INFO,
+    datefmt='%H:%M:%S')
+
+class h2m_point():
+    __slots__ = ("system_name", "sensor_name", "wall", "record")
+
+    def __init__(self, system_name, sensor_name, wall, record) -> None:
+        self.system_name = system_name
+        self.sensor_name = sensor_name
+        self.wall = wall
+        self.record = record
+
+class h2m_sink():
+    """Output of the per frame records passed to h2m_helper.record(), besides MQTT.
+
+    put() only queues, a background thread writes batches of up to batch_size points,
+    or whatever is queued after flush_interval seconds. The queue is bounded, when a
+    sink can not keep up its oldest points are dropped, so a slow sink never stalls the
+    bridge or the other sinks. Subclasses implement write(points).
+    """
+    def __init__(self, name, loglevel, capacity=10000, batch_size=100, flush_interval=1.0) -> None:
+        logging.getLogger().setLevel(loglevel)
+        self.name = name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.points = deque(maxlen=capacity)
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+
+        # counters
+        self.queued = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.__run, name=f"h2m-sink-{self.name}", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5.0):
+        """Write what is still queued and stop the thread."""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=timeout)
+            self.thread = None
+        self.close()
+
+    def put(self, system_name, sensor_name, record, wall=None):
+        if wall is None:
+            wall = time.time()
+        with self.condition:
+            if len(self.points) == self.points.maxlen:
+                self.dropped += 1
+            self.points.append(h2m_point(system_name, sensor_name, wall, record))
+            self.queued += 1
+            if len(self.points) >= self.batch_size:
+                self.condition.notify()
+
+    def __take(self):
+        count = min(len(self.points), self.batch_size)
+        return [self.points.popleft() for _ in range(count)]
+
+    def __run(self):
+        while True:
+            with self.condition:
+                deadline = time.monotonic() + self.flush_interval
+                while self.running and len(self.points) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(timeout=remaining)
+                batch = self.__take()
+                running = self.running
+            if batch:
+                self.flush(batch)
+            if not running and not self.points:
+                return
+
+    def flush(self, batch):
+        try:
+            self.write(batch)
+            self.written += len(batch)
+            self.batches += 1
+        except Exception as e:
+            self.failed += len(batch)
+            logging.warning(f"Sink {self.name}: writing {len(batch)} points failed: {e}")
+
+    def write(self, points):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {
+            "depth": len(self.points),
+            "queued": self.queued,
+            "dropped": self.dropped,
+            "written": self.written,
+            "batches": self.batches,
+            "failed": self.failed,
+        }
+
+def escape_key(value):
+    return value.replace("\\", "\\\\").replace(",", "\\,").replace("=", "\\=").replace(" ", "\\ ")
+
+def escape_string(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+class h2m_influx_sink(h2m_sink):
+    """Writes InfluxDB line protocol, one line per point tagged with system and sensor.
+
+    target is "udp://host:port", an http(s) write URL (e.g. http://localhost:8086/api/v2/write?org=home&bucket=hargassner)
+    or a file path, e.g. for the telegraf tail input. A callable target gets the encoded
+    batch, to stand in for the database.
+    """
+    def __init__(self, target, loglevel, measurement="hargassner", token=None, timeout=5.0, max_datagram=1400, **sink_args) -> None:
+        super().__init__("influx", loglevel, **sink_args)
+        self.target = target
+        self.measurement = escape_key(measurement)
+        self.token = token
+        self.timeout = timeout
+        self.max_datagram = max_datagram
+        self.socket = None
+        self.address = None
+        self.schema = None
+        self.encoders = None
+        if callable(target):
+            self.transport = target
+        elif target.startswith("udp://"):
+            # only loaded when the transport is used
+            import socket
+            host, _, port = target[len("udp://"):].rpartition(":")
+            self.address = (host, int(port))
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.transport = self.__send_udp
+        elif target.startswith(("http://", "https://")):
+            self.transport = self.__send_http
+        else:
+            self.transport = self.__append_file
+
+    def __setup(self, fields):
+        # escaped keys and value formatting are computed once per schema
+        encoders = []
+        for meta in fields:
+            key = escape_key(meta.field)
+            if meta.field_type == FieldType.BOOL:
+                encoders.append((key, lambda value: "true" if value else "false"))
+            elif meta.field_type == FieldType.INT:
+                encoders.append((key, lambda value: f"{int(value)}i"))
+            elif meta.field_type == FieldType.FLOAT:
+                encoders.append((key, repr))
+            else:
+                encoders.append((key, lambda value: f'"{escape_string(str(value))}"'))
+        self.schema = fields
+        self.encoders = encoders
+
+    def encode(self, point):
+        record = point.record
+        if record.fields is not self.schema:
+            self.__setup(record.fields)
+        values = ",".join(f"{key}={encode(value)}" for (key, encode), value in zip(self.encoders, record.values) if value is not None)
+        return f"{self.measurement},system={escape_key(point.system_name)},sensor={escape_key(point.sensor_name)} {values} {int(point.wall * 1e9)}"
+
+    def write(self, points):
+        self.transport("\n".join(self.encode(point) for point in points).encode("utf-8") + b"\n")
+
+    def __send_udp(self, data):
+        # as many whole lines per datagram as fit into max_datagram
+        datagram = b""
+        for line in data.splitlines(keepends=True):
+            if datagram and len(datagram) + len(line) > self.max_datagram:
+                self.socket.sendto(datagram, self.address)
+                datagram = b""
+            datagram += line
+        if datagram:
+            self.socket.sendto(datagram, self.address)
+
+    def __send_http(self, data):
+        import urllib.request
+        request = urllib.request.Request(self.target, data=data, method="POST", headers={"Content-Type": "text/plain; charset=utf-8"})
+        if self.token is not None:
+            request.add_header("Authorization", f"Token {self.token}")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    def __append_file(self, data):
+        with open(self.target, "ab") as lines:
+            lines.write(data)
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+class h2m_ndjson_sink(h2m_sink):
+    """Appends one JSON object per point to a file, rotated like logging's RotatingFileHandler.
+
+    When the file would grow past max_bytes it is renamed to path.1 (path.1 to path.2 ...)
+    and backups files are kept.
+    """
+    def __init__(self, path, loglevel, max_bytes=10 * 1024 * 1024, backups=5, **sink_args) -> None:
+        super().__init__("ndjson", loglevel, **sink_args)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.file = None
+        self.size = 0
+
+    def encode(self, point):
+        data = {
+            "time": datetime.datetime.fromtimestamp(point.wall, datetime.UTC).isoformat(),
+            "system": point.system_name,
+            "sensor": point.sensor_name,
+        }
+        for meta, value in point.record.items():
+            data[meta.field] = value
+        return json.dumps(data, ensure_ascii=False)
+
+    def write(self, points):
+        data = "".join(self.encode(point) + "\n" for point in points).encode("utf-8")
+        if self.file is None:
+            self.file = open(self.path, "ab")
+            self.size = self.file.tell()
+        if self.size > 0 and self.size + len(data) > self.max_bytes:
+            self.rotate()
+        self.file.write(data)
+        self.file.flush()
+        self.size += len(data)
+
+    def rotate(self):
+        self.file.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.file = open(self.path, "ab")
+        self.size = 0
+        logging.debug(f"Rotated {self.path}")
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,124 @@
+import logging
+import os
+import sqlite3
+import time
+
+logging.basicConfig(
+    format='[%(asctime)s] %(levelname)-2s %(message)s',
+    level=logging.INFO,
+    datefmt='%H:%M:%S')
+
+class h2m_store():
+    """Disk backed queue for state messages which could not be published.
+
+    Messages are kept in sqlite with their capture time, the oldest ones are evicted when
+    the queue is full. Commits (and with it fsync) are batched.
+    """
+    def __init__(self, path, loglevel, max_messages=50000, drain_rate=20, commit_batch=50, commit_interval=5.0) -> None:
+        logging.getLogger().setLevel(loglevel)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_messages = max_messages
+        self.drain_rate = drain_rate
+        self.commit_batch = commit_batch
+        self.commit_interval = commit_interval
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS queue (id INTEGER PRIMARY KEY AUTOINCREMENT, captured REAL, topic TEXT, payload BLOB, qos INTEGER, retain INTEGER)")
+        self.db.commit()
+
+        self.depth = self.db.execute("SELECT COUNT(*) FROM queue").fetchone()[0]
+        self.uncommitted = 0
+        self.last_commit = time.monotonic()
+        self.last_drain = None
+        self.drain_tokens = 0.0
+
+        # counters
+        self.enqueued = 0
+        self.evicted = 0
+        self.drained = 0
+        self.measured_drain_rate = 0.0
+        if self.depth > 0:
+            logging.info(f"Store {self.path} has {self.depth} queued messages")
+
+    def put(self, topic, payload, qos=0, retain=False, captured=None):
+        if captured is None:
+            captured = time.time()
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        self.db.execute("INSERT INTO queue (captured, topic, payload, qos, retain) VALUES (?, ?, ?, ?, ?)", (captured, topic, payload, qos, int(retain)))
+        self.depth += 1
+        self.enqueued += 1
+
+        if self.depth > self.max_messages:
+            overflow = self.depth - self.max_messages
+            self.db.execute("DELETE FROM queue WHERE id IN (SELECT id FROM queue ORDER BY id LIMIT ?)", (overflow,))
+            self.depth -= overflow
+            self.evicted += overflow
+            logging.debug(f"Store full, evicted {overflow} oldest messages")
+
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_batch or time.monotonic() - self.last_commit >= self.commit_interval:
+            self.commit()
+
+    def commit(self):
+        if self.uncommitted > 0:
+            self.db.commit()
+            self.uncommitted = 0
+        self.last_commit = time.monotonic()
+
+    def drain(self, publish_callback, now=None):
+        """Publish queued messages oldest first, at most drain_rate messages per second.
+
+        publish_callback(topic, payload, qos, retain) returns False if the message was not sent,
+        draining stops there and the message stays queued.
+        """
+        if now is None:
+            now = time.monotonic()
+        if self.last_drain is None or self.depth == 0:
+            self.last_drain = now
+            self.drain_tokens = 1.0
+            if self.depth == 0:
+                self.measured_drain_rate = 0.0
+                return 0
+        elapsed = now - self.last_drain
+        self.last_drain = now
+        # allow to catch up for at most 10s of missed drain calls
+        self.drain_tokens = min(self.drain_tokens + elapsed * self.drain_rate, float(max(self.drain_rate * 10, 1)))
+        limit = int(self.drain_tokens)
+        if limit == 0:
+            return 0
+
+        self.commit()
+        sent = []
+        rows = self.db.execute("SELECT id, topic, payload, qos, retain FROM queue ORDER BY id LIMIT ?", (limit,)).fetchall()
+        for row_id, topic, payload, qos, retain in rows:
+            if not publish_callback(topic, payload, qos, bool(retain)):
+                break
+            sent.append((row_id,))
+        if sent:
+            self.db.executemany("DELETE FROM queue WHERE id = ?", sent)
+            self.db.commit()
+            self.depth -= len(sent)
+            self.drained += len(sent)
+            self.drain_tokens -= len(sent)
+            logging.debug(f"Drained {len(sent)} messages from store, {self.depth} left")
+        self.measured_drain_rate = len(sent) / elapsed if elapsed > 0 else 0.0
+        return len(sent)
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+    def stats(self):
+        return {
+            "depth": self.depth,
+            "enqueued": self.enqueued,
+            "evicted": self.evicted,
+            "drained": self.drained,
+            "drain_rate": round(self.measured_drain_rate, 2),
+        }
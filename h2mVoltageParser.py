@@ -1,4 +1,4 @@
-from h2mHelper import h2m_data, FieldType
+from h2mHelper import h2m_field, h2m_record, FieldType
 import logging
 
 logging.basicConfig(
@@ -6,6 +6,12 @@ logging.basicConfig(
     level=logging.INFO,
     datefmt='%H:%M:%S')
 
+FIELDS = (
+    h2m_field("heizungsdruck", "Heizungsdruck", field_type=FieldType.FLOAT, device_clazz="pressure", unit="bar", icon="mdi:water-boiler", state_clazz="measurement", deadband=(0.05, 0.0)),
+    h2m_field("heizungsdruck_stoerung", "Heizungsdruck Störung", field_type=FieldType.BOOL, device_clazz="problem"),
+    h2m_field("heizungsdruck_statusnachricht", "Heizungsdruck Status", category="diagnostic", enabled=False),
+)
+
 class h2m_voltage_parser():
     def __init__(self, loglevel) -> None:
         logging.getLogger().setLevel(loglevel)
@@ -28,18 +34,14 @@ class h2m_voltage_parser():
 
     def parse(self, voltage):
         logging.debug(f"Parsing: {voltage}")
-        parsed_values = []
         try:
             if not isinstance(voltage, float):
                 logging.debug(f"no float")
-                return parsed_values, False
+                return [], False
             voltage = round(voltage, 5)
+            status = self.__volt_2_stat(voltage)
 
-            parsed_values.append(h2m_data("heizungsdruck", self.__volt_2_bar(voltage), "Heizungsdruck", field_type=FieldType.FLOAT, device_clazz="pressure", unit="bar", icon="mdi:water-boiler", state_clazz="measurement"))
-            parsed_values.append(h2m_data("heizungsdruck_stoerung", str(self.__volt_2_stat(voltage) != "Ok"), "Heizungsdruck Störung", field_type=FieldType.BOOL, device_clazz="problem"))
-            parsed_values.append(h2m_data("heizungsdruck_statusnachricht", self.__volt_2_stat(voltage), "Heizungsdruck Status", category="diagnostic", enabled=False))
-
-            return parsed_values, True
+            return h2m_record(FIELDS, [self.__volt_2_bar(voltage), status != "Ok", status]), True
         except Exception as e:
             logging.debug(f"Parse failed: {e}")
-            return parsed_values, False
+            return [], False
@@ -0,0 +1,114 @@
+from collections import deque
+import logging
+import statistics
+import threading
+import time
+
+logging.basicConfig(
+    format='[%(asctime)s] %(levelname)-2s %(message)s',
+    level=logging.INFO,
+    datefmt='%H:%M:%S')
+
+class h2m_voltage_sampler():
+    """Samples ADS1115 channels in a background thread.
+
+    A single channel is sampled in continuous-conversion mode. With a list of channels of
+    the same ADS1115 (one per boiler) they are converted in single-shot mode one after the
+    other, the thread is the only user of the I2C bus. The newest `window` samples per
+    channel are kept, voltage() returns their median or trimmed mean so a single noisy
+    conversion does not show up in the pressure.
+    """
+    def __init__(self, ads, channel, loglevel, data_rate=128, window=64, filter="median", trim=0.2, metrics=None) -> None:
+        logging.getLogger().setLevel(loglevel)
+        if filter not in ("median", "trimmed_mean"):
+            raise ValueError(f"unknown filter: {filter}")
+        self.ads = ads
+        self.channels = list(channel) if isinstance(channel, (list, tuple)) else [channel]
+        self.data_rate = data_rate
+        self.filter = filter
+        self.trim = trim
+        self.metrics = metrics
+        self.samples = [deque(maxlen=window) for _ in self.channels]
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+        # counters
+        self.samples_read = 0
+        self.read_errors = 0
+
+    def __configure(self):
+        from adafruit_ads1x15.ads1x15 import Mode
+
+        self.ads.data_rate = self.data_rate
+        # continuous conversion can only follow one channel
+        self.ads.mode = Mode.CONTINUOUS if len(self.channels) == 1 else Mode.SINGLE
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.__configure()
+        # one synchronous read, voltage() has a value before the thread delivers the first sample
+        for samples, channel in zip(self.samples, self.channels):
+            voltage = channel.voltage
+            with self.lock:
+                samples.append(voltage)
+                self.samples_read += 1
+        self.running = True
+        self.thread = threading.Thread(target=self.__run, name="h2m-voltage-sampler", daemon=True)
+        self.thread.start()
+        logging.debug(f"Started voltage sampler of {len(self.channels)} channels at {self.data_rate} samples/s")
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+            self.thread = None
+
+    def __run(self):
+        # single-shot reads wait for their conversion themselves
+        interval = 1.0 / self.data_rate if len(self.channels) == 1 else 0.0
+        while self.running:
+            for samples, channel in zip(self.samples, self.channels):
+                start = time.perf_counter()
+                try:
+                    voltage = channel.voltage
+                except Exception as e:
+                    self.read_errors += 1
+                    logging.debug(f"ADC read failed: {e}")
+                    time.sleep(1)
+                    continue
+                if self.metrics is not None:
+                    self.metrics.observe("h2m_stage_seconds", time.perf_counter() - start, stage="adc_read")
+                with self.lock:
+                    samples.append(voltage)
+                    self.samples_read += 1
+            time.sleep(interval)
+
+    def voltage(self, index=0):
+        """Filtered voltage of the buffered samples of a channel, None if there are none yet."""
+        with self.lock:
+            samples = list(self.samples[index])
+        return self.filtered(samples)
+
+    def source(self, index):
+        """voltage_source of h2m_bridge for one channel."""
+        return lambda: self.voltage(index)
+
+    def filtered(self, samples):
+        if len(samples) == 0:
+            return None
+        if self.filter == "median":
+            return float(statistics.median(samples))
+        samples = sorted(samples)
+        cut = int(len(samples) * self.trim)
+        if cut > 0 and len(samples) > 2 * cut:
+            samples = samples[cut:-cut]
+        return float(sum(samples) / len(samples))
+
+    def stats(self):
+        return {
+            "samples_read": self.samples_read,
+            "read_errors": self.read_errors,
+            "samples_buffered": sum(len(samples) for samples in self.samples),
+        }
@@ -32,9 +32,162 @@ mqtt_subscription = 'none'
 # On macOS, this will usually be similar to '/dev/cu.usbmodem333101'
 serial_portname = '/dev/ttyS0'
 
+# Read the heating pressure sensor from an ADS1115 on the I2C bus.
+adc_enabled = True
+
+# Boilers bridged by this process, all share the MQTT connection and the I2C bus.
+# name is the system in Home Assistant and has to be unique, serial_port the connection to the
+# Lambdatronic and adc_channel the ADS1115 input (0-3) of its pressure sensor, None without one.
+# adc_address selects one of several ADS1115 on the bus (default 0x48), counters_path overrides the
+# counter file (default counters_path, with more than one boiler suffixed with the name).
+boilers = [
+    {"name": "HSV30", "serial_port": serial_portname, "adc_channel": 0},
+]
+
+# Interval in seconds between two checks of the buffered serial frames, independent of the
+# publish mode so a status change or an alarm is seen within one frame.
+publish_interval = 0.5
+
+# Seconds after which unchanged values are published again (heartbeat).
+publish_max_interval = 300
+
+# Minimum (absolute, relative) change per field type before a value is published again.
+publish_type_deadbands = {
+    "FLOAT": (0.5, 0.0),
+}
+
+# Minimum (absolute, relative) change per field, overrides the field type deadband.
+# e.g. {"temperatur_aussen_mittel": (0.2, 0.0)}
+publish_field_deadbands = {}
+
+# File of the store-and-forward queue for state messages while the broker is unreachable, None to disable.
+store_path = '/var/lib/hargassner2mqtt/queue.sqlite'
+
+# Maximum number of queued messages, the oldest messages are dropped first.
+store_max_messages = 50000
+
+# Messages per second published from the queue after reconnecting.
+store_drain_rate = 20
+
+# Number of serial frames (0.5s each) aggregated into one published value (mean, on at any time).
+aggregation_window = 20
+
+# Publish the min/max of each window and the on-fraction of binary sensors as extra (disabled) entities.
+aggregation_extra_entities = False
+
+# Samples per second of the ADS1115 in continuous-conversion mode (8, 16, 32, 64, 128, 250, 475, 860).
+adc_data_rate = 128
+
+# Number of ADC samples the pressure is filtered over.
+adc_filter_window = 64
+
+# Filter of the ADC samples, "median" or "trimmed_mean".
+adc_filter = "median"
+
+# Local port of the Prometheus metrics endpoint, None to disable.
+metrics_port = 9105
+metrics_address = '127.0.0.1'
+
+# Seconds between two publishes of the metrics to the diagnostics topic, None to disable.
+metrics_publish_interval = 60
+metrics_topic = 'hargassner/bridge/diagnostics'
+
+# Maximum number of QoS 1/2 messages waiting for the broker acknowledgement.
+publish_window = 20
+
+# File the runtime, start and fuel counters are saved to, None to disable the counters.
+counters_path = '/var/lib/hargassner2mqtt/counters.json'
+
+# Pellets in kg per hour at a Fördermenge of 100%, for the fuel consumption estimate.
+fuel_kg_per_hour = 6.5
+
+# Publish modes as (frames aggregated per publish, heartbeat seconds).
+schedule_modes = {
+    "fast": (1, 60),
+    "normal": (aggregation_window, publish_max_interval),
+    "idle": (120, 900),
+}
+
+# Publish mode per boiler status (see STATUS_TEXT in h2mSerialParser.py), None to always use the normal mode.
+schedule_status_modes = {
+    0: "idle",        # Aus
+    6: "fast",        # BSK öffnet
+    7: "fast",        # Zündung
+    9: "fast",        # Zündung
+    10: "fast",       # Zündung
+    14: "normal",     # Leistungsbrand
+    15: "normal",     # Gluterhaltung
+    17: "normal",     # Entaschung in 10 min
+    18: "fast",       # Entaschen
+}
+
+# Publish mode while a binary field is on, the mode with the fewest frames per publish wins.
+schedule_field_modes = {
+    "stoerung": "fast",
+}
+
+# Write every sent record as InfluxDB line protocol, None to disable.
+# 'udp://localhost:8089', an http write URL like 'http://localhost:8086/api/v2/write?org=home&bucket=hargassner'
+# or a file, e.g. for the telegraf tail input.
+influx_target = None
+influx_token = None
+
+# Write every sent record as one JSON line to a rotating file, None to disable.
+ndjson_path = None
+ndjson_max_bytes = 10 * 1024 * 1024
+ndjson_backups = 5
+
+# Home Assistant discovery, "entity" sends one config per measurement, "device" one config for all of them.
+discovery_mode = "entity"
+# Remove the retained configs of the other mode once after switching. When the broker accepted all
+# of them the mode is written to discovery_marker_path (None: once per start of the process).
+discovery_cleanup = True
+discovery_marker_path = '/var/lib/hargassner2mqtt/discovery_mode'
+
+# State payload, "string" sends every value as JSON string, "typed" as JSON number or boolean
+# (smaller and no conversion in the templates, uses orjson if installed).
+publish_payload = "string"
+
+# Directory of the archive of every captured frame, one subdirectory per boiler, None to disable.
+# Read it with h2mArchive.py, e.g. to export CSV or a recording for h2mReplay.py.
+archive_path = None
+# "raw" keeps every line as received, "columns" only the numbers of well-formed frames (smaller).
+archive_mode = "raw"
+# Size and age of a segment file, and of all segments before the oldest are deleted.
+archive_segment_bytes = 16 * 1024 * 1024
+archive_segment_seconds = 86400
+archive_retention_bytes = 2 * 1024 * 1024 * 1024
+archive_retention_seconds = 90 * 86400
+
+# Alarms evaluated on every frame, published at once to hargassner/<system>/alarms and as problem
+# binary sensors. A rule holds while field equals one of the values, is above or below the limits
+# (with rate_window: its change per minute over that many seconds), for "for" seconds, while the
+# optional "when" condition holds. Active alarms clear after being back inside by hysteresis.
+alarm_rules = [
+    {"name": "druck_niedrig", "visible_name": "Heizungsdruck niedrig", "field": "heizungsdruck", "below": 1.0, "hysteresis": 0.1, "for": 10},
+    {"name": "druck_abfall", "visible_name": "Heizungsdruck fällt", "field": "heizungsdruck", "rate_window": 60, "below": -0.1},
+    {"name": "stoerung", "visible_name": "Störung", "field": "stoerung", "equals": [True], "severity": "critical"},
+    {"name": "o2_ausserhalb", "visible_name": "O2 außerhalb", "field": "o2_im_rauchgas", "below": 4.0, "above": 14.0, "for": 300,
+     "when": {"field": "status", "equals": [14]}},
+    {"name": "zuendung_ohne_temperaturanstieg", "visible_name": "Zündung ohne Temperaturanstieg", "field": "temperatur_rauchgas",
+     "rate_window": 300, "below": 2.0, "for": 300, "when": {"field": "status", "equals": [7, 9, 10]}},
+]
+
+# Publish the bits of the register columns (pumps, augers, mixers ...) as events on
+# hargassner/<system>/<sensor>/events when they change, checked on every frame, instead of in
+# every state payload. Short pulses between two state publishes are seen too, all bits are
+# sent again with the first event after max_interval or when home assistant comes online.
+bit_events = False
+
+# Number of serial frames kept by the background reader (hargassner writes every 0.5s).
+serial_buffer_size = 120
+
 ################################################################
 # Import standard Python libraries.
-import sys, time, signal, datetime, json, logging
+import os, sys, time, signal, json, logging
+
+# Start of the process, for the time to first publish
+startup_time = time.monotonic()
 
 # Import the MQTT client library.
 # documentation: https://www.eclipse.org/paho/clients/python/docs/
@@ -44,28 +197,33 @@ import paho.mqtt.client as mqtt
 # documentation: https://pyserial.readthedocs.io/en/latest/
 import serial
 
-# import arduino stuff
-import board
-import busio
-from adafruit_ads1x15.ads1115 import ADS1115
-from adafruit_ads1x15.analog_in import AnalogIn
-
 # import hargassner2mqtt stuff
-from h2mHelper import h2m_helper, h2m_data, FieldType
-from h2mSerialParser import h2m_serial_parser
-from h2mVoltageParser import h2m_voltage_parser
+from h2mHelper import h2m_helper, FieldType, HA_STATUS_TOPIC
+from h2mBoiler import h2m_boiler
+from h2mStore import h2m_store
+from h2mVoltageSampler import h2m_voltage_sampler
+from h2mMetrics import h2m_metrics
+from h2mPublisher import h2m_publisher
+from h2mCounters import h2m_counters, DEFAULT_COUNTERS, fuel
+from h2mScheduler import h2m_scheduler, h2m_mode
+from h2mSinks import h2m_influx_sink, h2m_ndjson_sink
+from h2mArchive import h2m_archive_writer
+from h2mAlarms import h2m_alarms, h2m_alarm_rule
+from h2mEvents import h2m_bit_events
 
 ################################################################
 # Global script variables.
 
-serial_port = None
+boiler_list = []
+voltage_samplers = []
+store = None
+publisher = None
+counters_list = []
+archives = []
+sinks = []
+metrics = None
 client = None
 h2m = None
-h2msp = None
-h2mvp = None
-tick = 0
-last_serial_input = None
-last_voltage = 0
 
 loglevel = logging.INFO
 
@@ -84,18 +242,38 @@ section at the top of the file.
     sys.exit(0)
 
 ################################################################
-# Attach a handler to the keyboard interrupt (control-C).
-def _sigint_handler(signal, frame):
-    logging.info("Keyboard interrupt caught, closing down...")
-    if serial_port is not None:
-        serial_port.close()
+# Attach a handler to the keyboard interrupt (control-C) and to SIGTERM (systemd stop),
+# both write the counters, the open archive block and the store before exiting.
+def _sigint_handler(signum, frame):
+    logging.info(f"{signal.Signals(signum).name} caught, closing down...")
+    for boiler in boiler_list:
+        boiler.stop()
+
+    for voltage_sampler in voltage_samplers:
+        voltage_sampler.stop()
 
     if client is not None:
         client.loop_stop()
 
+    for counters in counters_list:
+        counters.checkpoint()
+
+    for archive in archives:
+        archive.close()
+
+    for sink in sinks:
+        sink.stop()
+
+    if publisher is not None:
+        publisher.stop()
+
+    if store is not None:
+        store.close()
+
     sys.exit(0)
 
 signal.signal(signal.SIGINT, _sigint_handler)
+signal.signal(signal.SIGTERM, _sigint_handler)
 ################################################################
 # MQTT networking functions.
 
@@ -113,10 +291,16 @@ def on_unsubscribe(client, userdata, mid, reason_code_list, properties):
 # The callback for when the broker responds to our connection request.
 def on_connect(client, userdata, flags, rc, properties):
     logging.info(f"MQTT connected with flags: {flags}, result code: {rc}, properties: {properties}")
+    metrics.inc("h2m_mqtt_connects_total")
 
     # Subscribing in on_connect() means that if we lose the connection and reconnect then subscriptions will be renewed.
     # The hash mark is a multi-level wildcard, so this will subscribe to all subtopics of 16223
     client.subscribe(mqtt_subscription)
+    client.subscribe(HA_STATUS_TOPIC)
+
+    # Discovery configs are announced once per broker session
+    if h2m is not None:
+        h2m.request_announce()
     return
 
 #----------------------------------------------------------------
@@ -131,6 +315,12 @@ def on_connect(client, userdata, flags, rc, properties):
 def on_message(client, userdata, msg):
     logging.debug(f"message received: topic: {msg.topic} payload: {msg.payload}")
 
+    # Home assistant birth message, it has to get all discovery configs again
+    if msg.topic == HA_STATUS_TOPIC and msg.payload == b"online":
+        logging.info("Home assistant is online, announcing measurements")
+        if h2m is not None:
+            h2m.request_announce()
+
     # If the serial port is ready, re-transmit received messages to the
     # device. The msg.payload is a bytes object which can be directly sent to
     # the serial port with an appended line ending.
@@ -138,15 +328,13 @@ def on_message(client, userdata, msg):
     #    serial_port.write(msg.payload + b'\n')
     return
 
-def data_transmit(topic, payload, qos=1, retain=False):
-    logging.debug(f"Publish to {topic}: {payload}, qos={qos}, retain={retain}")
-    client.publish(topic, payload=payload, qos=qos, retain=retain)
+def on_publish(client, userdata, mid, reason_code, properties):
+    if publisher is not None:
+        publisher.on_publish()
 
-class Pin:
-    ZERO = 0
-    ONE = 1
-    TWO = 2
-    THREE = 3
+def data_transmit(topic, payload, qos=1, retain=False, coalesce=True, on_sent=None):
+    logging.debug(f"Publish to {topic}: {payload}, qos={qos}, retain={retain}")
+    publisher.publish(topic, payload, qos=qos, retain=retain, coalesce=coalesce, on_sent=on_sent)
 
 #----------------------------------------------------------------
 # configure logging
@@ -156,6 +344,16 @@ logging.basicConfig(
     datefmt='%H:%M:%S')
 logging.getLogger().setLevel(loglevel)
 
+#----------------------------------------------------------------
+# Runtime metrics of the bridge
+metrics = h2m_metrics(loglevel)
+metrics.describe("h2m_stage_seconds", "Duration of the pipeline stages")
+metrics.describe("h2m_frames_invalid_total", "Invalid serial frames per reason")
+metrics.describe("h2m_mqtt_connects_total", "MQTT connects, the first one and every reconnect")
+metrics.describe("h2m_warnings_total", "Warnings per kind, also the rate limited ones")
+if metrics_port is not None:
+    metrics.serve(metrics_port, metrics_address)
+
 #----------------------------------------------------------------
 # Launch the MQTT network client
 client = mqtt.Client(client_id="Hargassner HSV-30", protocol=mqtt.MQTTv5)
@@ -163,68 +361,161 @@ client.enable_logger()
 client.on_connect = on_connect
 client.on_unsubscribe = on_unsubscribe
 client.on_message = on_message
+client.on_publish = on_publish
 #client.tls_set()
 client.username_pw_set(mqtt_username, mqtt_password)
 
-# Start a background thread to connect to the MQTT network.
-client.connect(mqtt_hostname, mqtt_portnum)
+# Connect in the background thread, the loop retries until the broker is reachable.
+client.connect_async(mqtt_hostname, mqtt_portnum)
 client.loop_start()
 
 ################################################################
-# Connect to the serial device.
-serial_port = serial.Serial(serial_portname, baudrate=19200, timeout=2.0)
-
-# wait briefly for the system to complete waking up
-time.sleep(2)
+# Create the ADCs on the I2C bus, the hardware libraries are only loaded if one is used.
+# An ADC which does not respond after a few attempts is left out, its boilers run without
+# the pressure instead of keeping all boilers from starting.
+def open_adc(i2c, address, channels, attempts=6):
+    from adafruit_ads1x15.ads1115 import ADS1115
+    from adafruit_ads1x15.analog_in import AnalogIn
+
+    delay = 0.1
+    for attempt in range(attempts):
+        try:
+            # Create the ADC object using the I2C bus
+            ads = ADS1115(i2c, address=address)
+            # Create a single-ended input per channel
+            inputs = [AnalogIn(ads, channel) for channel in channels]
+            # probe until the ADC responds
+            for analog_in in inputs:
+                analog_in.voltage
+            return ads, inputs
+        except (OSError, RuntimeError, ValueError) as e:
+            metrics.warn("adc_open", f"Opening the ADS1115 at {address:#x} failed: {e}")
+            if attempt < attempts - 1:
+                time.sleep(delay)
+                delay = min(delay * 2, 5.0)
+    logging.error(f"ADS1115 at {address:#x} not available, running without the pressure of {len(channels)} channels")
+    return None, None
+
+# boiler name -> voltage source
+voltage_sources = {}
+adc_channels = {}
+for boiler_config in boilers:
+    if adc_enabled and boiler_config.get("adc_channel") is not None:
+        adc_channels.setdefault(boiler_config.get("adc_address", 0x48), []).append((boiler_config["name"], boiler_config["adc_channel"]))
+if adc_channels:
+    import board
+    import busio
+    # Create the I2C bus, shared by all ADCs
+    try:
+        i2c = busio.I2C(board.SCL, board.SDA)
+    except (OSError, RuntimeError, ValueError) as e:
+        logging.error(f"Opening the I2C bus failed, running without the pressure: {e}")
+        adc_channels = {}
+    for address, channels in adc_channels.items():
+        ads, inputs = open_adc(i2c, address, [channel for _, channel in channels])
+        if ads is None:
+            continue
+        # one sampler per ADS1115, it converts the channels of all boilers on it one after the other
+        voltage_sampler = h2m_voltage_sampler(ads, inputs, loglevel, data_rate=adc_data_rate, window=adc_filter_window, filter=adc_filter, metrics=metrics.labeled(adc=f"{address:#x}"))
+        voltage_sampler.start()
+        voltage_samplers.append(voltage_sampler)
+        metrics.gauge("h2m_adc_samples_read", lambda voltage_sampler=voltage_sampler: voltage_sampler.samples_read, adc=f"{address:#x}")
+        metrics.gauge("h2m_adc_read_errors", lambda voltage_sampler=voltage_sampler: voltage_sampler.read_errors, adc=f"{address:#x}")
+        for index, (name, _) in enumerate(channels):
+            voltage_sources[name] = voltage_sampler.source(index)
+logging.info(f"Hardware ready after {time.monotonic() - startup_time:.2f}s")
+
+if influx_target is not None:
+    sinks.append(h2m_influx_sink(influx_target, loglevel, token=influx_token))
+if ndjson_path is not None:
+    sinks.append(h2m_ndjson_sink(ndjson_path, loglevel, max_bytes=ndjson_max_bytes, backups=ndjson_backups))
+for sink in sinks:
+    sink.start()
+    for name in ("depth", "dropped", "written", "failed"):
+        metrics.gauge(f"h2m_sink_{name}", lambda sink=sink, name=name: sink.stats()[name], sink=sink.name)
+
+h2m = h2m_helper(data_transmit, loglevel,
+                 deadbands={FieldType[field_type]: deadband for field_type, deadband in publish_type_deadbands.items()},
+                 field_deadbands=publish_field_deadbands,
+                 max_interval=publish_max_interval,
+                 sinks=sinks,
+                 discovery=discovery_mode,
+                 discovery_cleanup=discovery_cleanup,
+                 discovery_marker=discovery_marker_path,
+                 payload=publish_payload)
+
+if store_path is not None:
+    store = h2m_store(store_path, loglevel, max_messages=store_max_messages, drain_rate=store_drain_rate)
+    metrics.gauge("h2m_store_depth", lambda: store.depth)
+    metrics.gauge("h2m_store_drain_rate", lambda: store.measured_drain_rate)
+
+publisher = h2m_publisher(client, loglevel, store=store, window=publish_window, metrics=metrics, started=startup_time)
+publisher.start()
+for name in ("depth", "in_flight", "queued", "coalesced", "dropped", "published", "failed", "stored", "window_full"):
+    metrics.gauge(f"h2m_publisher_{name}", lambda name=name: publisher.stats()[name])
+metrics.gauge("h2m_first_publish_seconds", lambda: publisher.first_publish if publisher.first_publish is not None else -1)
+metrics.describe("h2m_mode_seconds", "Seconds spent in each publish mode")
 
 ################################################################
-# Create the I2C bus
-i2c = busio.I2C(board.SCL, board.SDA)
-
-# Create the ADC object using the I2C bus
-ads= ADS1115(i2c)
-# Create single-ended input on channel 0
-chan0 = AnalogIn(ads, Pin.ZERO)
-
-# wait briefly for the system to complete waking up
-time.sleep(2)
-
-logging.info(f"Entering event loop for {serial_portname} and {chan0}.  Enter Control-C to quit.")
-
-h2msp = h2m_serial_parser(loglevel)
-h2mvp = h2m_voltage_parser(loglevel)
+# One bridge per boiler, each in its own thread.
+for boiler_config in boilers:
+    name = boiler_config["name"]
+    boiler_metrics = metrics.labeled(boiler=name)
+
+    counters = None
+    boiler_counters_path = boiler_config.get("counters_path", counters_path)
+    if boiler_counters_path is not None and "counters_path" not in boiler_config and len(boilers) > 1:
+        root, extension = os.path.splitext(boiler_counters_path)
+        boiler_counters_path = f"{root}_{h2m.sanitize(name)}{extension}"
+    if boiler_counters_path is not None:
+        counters = h2m_counters(loglevel, counters=DEFAULT_COUNTERS + (fuel(fuel_kg_per_hour),), path=boiler_counters_path)
+        counters_list.append(counters)
+
+    scheduler = None
+    if schedule_status_modes is not None:
+        scheduler = h2m_scheduler(loglevel, modes=tuple(h2m_mode(mode_name, *mode) for mode_name, mode in schedule_modes.items()),
+                                  status_modes=schedule_status_modes, field_modes=schedule_field_modes)
+        for mode_name in schedule_modes:
+            boiler_metrics.gauge("h2m_mode_seconds", lambda scheduler=scheduler, mode_name=mode_name: round(scheduler.residency[mode_name], 1), mode=mode_name)
+        boiler_metrics.gauge("h2m_mode_transitions", lambda scheduler=scheduler: scheduler.transitions)
+
+    archive = None
+    if archive_path is not None:
+        archive = h2m_archive_writer(os.path.join(archive_path, h2m.sanitize(name)), loglevel, mode=archive_mode,
+                                     segment_bytes=archive_segment_bytes, segment_seconds=archive_segment_seconds,
+                                     retention_bytes=archive_retention_bytes, retention_seconds=archive_retention_seconds)
+        archives.append(archive)
+
+    alarms = None
+    if alarm_rules:
+        alarms = h2m_alarms(loglevel, [h2m_alarm_rule.from_config(rule) for rule in alarm_rules])
+        boiler_metrics.gauge("h2m_alarms_active", lambda alarms=alarms: alarms.stats()["active"])
+        boiler_metrics.gauge("h2m_alarm_evaluations", lambda alarms=alarms: alarms.evaluations)
+
+    events = None
+    if bit_events:
+        events = h2m_bit_events(loglevel)
+        boiler_metrics.gauge("h2m_bit_changes", lambda events=events: events.changes)
+
+    boiler = h2m_boiler(name, lambda port=boiler_config["serial_port"]: serial.Serial(port, baudrate=19200, timeout=2.0), h2m, loglevel,
+                        voltage_source=voltage_sources.get(name), metrics=boiler_metrics, poll_interval=publish_interval, buffer_size=serial_buffer_size,
+                        sensor_name="Lambdatronic", aggregation_window=aggregation_window, aggregation_extra_entities=aggregation_extra_entities,
+                        counters=counters, scheduler=scheduler, archive=archive, alarms=alarms, events=events)
+    for stat in ("port_open", "port_opens", "errors", "bytes_read", "bytes_skipped", "frames_received", "frames_dropped", "frames_overwritten", "frames_buffered"):
+        boiler_metrics.gauge(f"h2m_serial_{stat}", lambda boiler=boiler, stat=stat: int(boiler.stats().get(stat, 0)))
+    boiler.start()
+    boiler_list.append(boiler)
+    logging.info(f"Started boiler {name} on {boiler_config['serial_port']}")
+
+logging.info(f"Entering event loop for {len(boiler_list)} boilers.  Enter Control-C to quit.")
 
 while(True):
-    if (tick == 0):
-        h2m = h2m_helper(data_transmit, loglevel)
-        last_serial_input = None
-        last_voltage = None
-    tick = (tick + 1) % 10
+    time.sleep(metrics_publish_interval if metrics_publish_interval is not None else 60)
 
     try:
-        # reset input buffer, hargassner is writing every 0.5s
-        serial_port.reset_input_buffer()
-        serial_input = serial_port.readline().decode(encoding='ascii',errors='ignore').strip()
-        parsed_serial_input, serial_data_valid = h2msp.parse(serial_input)
-        voltage = chan0.voltage
-        parsed_voltage, voltage_data_valid = h2mvp.parse(voltage)
-        if not serial_data_valid or not voltage_data_valid:
-            logging.warning(f"serial={serial_input}, serial_data_valid={serial_data_valid}, voltage={voltage}, voltage_data_valid={voltage_data_valid}")
-        elif serial_input == last_serial_input:
-            logging.debug(f"serial input unchanged")
-        else:
-            if client.is_connected():
-                last_serial_input = serial_input
-                last_voltage = voltage
-                data = [
-                    h2m_data("raw_data_serial", serial_input, "Raw Serial Data", enabled=False, category="diagnostic"),
-                    h2m_data("raw_data_voltage", voltage, "Raw Voltage Data", enabled=False, category="diagnostic", device_clazz="voltage", unit="V", field_type=FieldType.FLOAT),
-                    h2m_data("last_seen", datetime.datetime.now(datetime.UTC).replace(microsecond=0).isoformat(), "Last Seen", category="diagnostic", icon="mdi:clock", device_clazz="timestamp")
-                ]
-                h2m.send("HSV30", "Lambdatronic", data + parsed_serial_input + parsed_voltage)
-                time.sleep(7)
+        for boiler in boiler_list:
+            logging.debug(f"boiler {boiler.name}: {boiler.stats()}")
+        if metrics_publish_interval is not None:
+            publisher.publish(metrics_topic, json.dumps(metrics.snapshot()), qos=0)
     except Exception as e:
         logging.error(f"{e}")
-    time.sleep(3)
-
-serial_port.close()